@@ -0,0 +1,204 @@
+""" Precomputed aggregate cube over the survey catalogue, for summary charts and tables.
+
+The cube has one cell per populated Facility x Selection Wavelength x Survey Status x
+Selection Type combination, holding the number of surveys, the Nspec and Area totals,
+and histograms of log10 Nspec, Area and Density in fixed bins of 1/BINS_PER_DEX dex
+that keep both the count and the sum of the values in every bin. Every statistic is
+additive, so:
+
+- rolling the cube up to any subset of the dimensions (spectra per facility, area per
+  selection wavelength, ...) sums cells, at a cost set by the number of populated
+  cells rather than the number of surveys;
+- quantiles of a group are read off its summed histogram, interpolated between order
+  statistics as pandas does. A value alone in its bin is known exactly (its bin's sum),
+  so quantiles are exact unless the values around them share a bin, and then within
+  that bin;
+- a reload only subtracts the rows of changed or removed survey files and adds the new
+  ones (AggregateCube.updated) instead of re-aggregating the whole catalogue.
+
+Like the Catalogue that holds it, a cube is never modified once built.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ('Facility', 'Selection Wavelength', 'Survey Status', 'Selection Type')
+MEASURES = ('Nspec', 'Area', 'Density')
+# Measures whose totals are meaningful (summed densities are not)
+TOTALS = ('Nspec', 'Area')
+QUANTILES = (0.1, 0.5, 0.9)
+
+# Histogram bins cover 10^LOG_MIN to 10^LOG_MAX; values outside go to the end bins
+LOG_MIN, LOG_MAX, BINS_PER_DEX = -6, 10, 20
+NBINS = (LOG_MAX - LOG_MIN) * BINS_PER_DEX
+
+selection_types = ['Magnitude', 'Colour', 'Other']
+
+
+def label(names, code):
+    return names[code] if 0 <= code < len(names) else str(code)
+
+
+def survey_cells(df):
+    """ Dimension values and (Nspec, Area, Density) of survey rows (as prepared by catalogue.prepare_frame). """
+    dims = {
+        'Facility': np.asarray(df['Facility'], dtype=object).astype(str),
+        'Selection Wavelength': np.asarray(df['Selection Wavelength'], dtype=object).astype(str),
+        'Survey Status': np.asarray(df['Survey Status'], dtype=object).astype(str),
+        'Selection Type': np.array([label(selection_types, code)
+                                    for code in np.asarray(df['Selection Type'], dtype=np.int64)], dtype=object),
+    }
+    nspec = pd.to_numeric(df['Nspec']).to_numpy(dtype=np.float64)
+    area = pd.to_numeric(df['Area']).to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        density = nspec / area
+    return dims, np.column_stack([nspec, area, density])
+
+
+def aggregate(df):
+    """ (cell keys, counts, totals, histogram counts, histogram sums) of the populated cells of some survey rows. """
+    dims, values = survey_cells(df)
+    factorized = [pd.factorize(dims[dim]) for dim in DIMENSIONS]
+    flat = np.ravel_multi_index([codes for codes, _ in factorized], [max(len(levels), 1) for _, levels in factorized])
+    cells, inverse = np.unique(flat, return_inverse=True)
+    codes = np.unravel_index(cells, [max(len(levels), 1) for _, levels in factorized])
+    keys = list(zip(*(levels[code] for (_, levels), code in zip(factorized, codes))))
+
+    count = np.bincount(inverse, minlength=len(cells))
+    totals = np.column_stack([np.bincount(inverse, weights=np.where(np.isfinite(values[:, m]), values[:, m], 0),
+                                          minlength=len(cells))
+                              for m in range(len(MEASURES))])
+    positive = np.isfinite(values) & (values > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bins = np.clip(np.floor((np.log10(values) - LOG_MIN) * BINS_PER_DEX), 0, NBINS - 1)
+    row, measure = np.nonzero(positive)
+    flat_bins = (inverse[row] * len(MEASURES) + measure) * NBINS + bins[row, measure].astype(np.int64)
+    shape = (len(cells), len(MEASURES), NBINS)
+    hist = np.bincount(flat_bins, minlength=np.prod(shape)).reshape(shape).astype(np.int32)
+    sums = np.bincount(flat_bins, weights=values[row, measure], minlength=np.prod(shape)).reshape(shape)
+    return keys, count, totals, hist, sums
+
+
+def histogram_quantiles(hist, sums, q):
+    """ Quantile q of the values in a histogram (counts and sums, ..., NBINS).
+
+    As pandas' default (linear) quantile: the order statistics either side of rank
+    q * (n - 1), interpolated linearly. Each order statistic is taken as the mean of the
+    values in its bin, which is exact for a value alone in its bin.
+    """
+    cumulative = np.cumsum(hist, axis=-1)
+    total = cumulative[..., -1:]
+    rank = q * np.maximum(total - 1, 0)
+    below = np.floor(rank)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / hist
+
+    def order_statistic(k):
+        bin_ = np.minimum(np.sum(cumulative <= k, axis=-1, keepdims=True), NBINS - 1)
+        return np.take_along_axis(means, bin_, axis=-1)
+
+    lower, upper = order_statistic(below), order_statistic(np.minimum(below + 1, np.maximum(total - 1, 0)))
+    with np.errstate(invalid='ignore'):
+        return np.where(total > 0, lower + (rank - below) * (upper - lower), np.nan)[..., 0]
+
+
+class AggregateCube:
+    """ Survey counts, totals and histograms per populated cell of DIMENSIONS. """
+
+    def __init__(self, keys, count, totals, hist, sums):
+        self.keys = keys  # one tuple of dimension values per cell
+        self.count, self.totals = count, totals
+        self.hist, self.sums = hist, sums  # count and sum of the values in each histogram bin
+        self.cells = {key: i for i, key in enumerate(keys)}
+        # Per dimension: the values present, and each cell's code into them
+        self.levels = [sorted({key[d] for key in keys}) for d in range(len(DIMENSIONS))]
+        lookup = [{value: code for code, value in enumerate(levels)} for levels in self.levels]
+        self.codes = np.array([[lookup[d][value] for d, value in enumerate(key)] for key in keys],
+                              dtype=np.int64).reshape(len(keys), len(DIMENSIONS))
+        self.lookup = dict(zip(DIMENSIONS, lookup))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(*aggregate(df))
+
+    @property
+    def surveys(self):
+        return int(self.count.sum())
+
+    def updated(self, removed=None, added=None):
+        """ A new cube with the survey rows in `removed` taken out and those in `added` put in. """
+        keys, cells = list(self.keys), dict(self.cells)
+        count, totals, hist, sums = self.count.copy(), self.totals.copy(), self.hist.copy(), self.sums.copy()
+        for df, sign in ((removed, -1), (added, 1)):
+            if df is None or len(df) == 0:
+                continue
+            delta_keys, delta_count, delta_totals, delta_hist, delta_sums = aggregate(df)
+            for key in delta_keys:
+                if key not in cells:
+                    cells[key] = len(keys)
+                    keys.append(key)
+            grow = len(keys) - len(count)
+            if grow:
+                count = np.concatenate([count, np.zeros(grow, dtype=count.dtype)])
+                totals = np.concatenate([totals, np.zeros((grow,) + totals.shape[1:])])
+                hist = np.concatenate([hist, np.zeros((grow,) + hist.shape[1:], dtype=hist.dtype)])
+                sums = np.concatenate([sums, np.zeros((grow,) + sums.shape[1:])])
+            # Cells are distinct within one aggregate(), so plain fancy-indexed adds are safe
+            positions = np.array([cells[key] for key in delta_keys], dtype=np.int64)
+            count[positions] += sign * delta_count
+            totals[positions] += sign * delta_totals
+            hist[positions] += sign * delta_hist
+            sums[positions] += sign * delta_sums
+        # Emptied bins must not keep rounding residue from the subtraction
+        sums[hist == 0] = 0
+        keep = count > 0
+        return AggregateCube([key for key, kept in zip(keys, keep) if kept], count[keep], totals[keep], hist[keep],
+                             sums[keep])
+
+    def select(self, where=None):
+        """ Boolean mask of the cells whose dimension values are in where[dimension] (None: any). """
+        mask = np.ones(len(self.keys), dtype=bool)
+        for dim, values in (where or {}).items():
+            if values is None:
+                continue
+            lookup = self.lookup[dim]
+            accepted = [lookup[value] for value in values if value in lookup]
+            mask &= np.isin(self.codes[:, DIMENSIONS.index(dim)], accepted)
+        return mask
+
+    def rollup(self, by=(), where=None, quantiles=QUANTILES):
+        """ One row per combination of the `by` dimensions, over the cells selected by `where`.
+
+        Columns: the `by` dimensions, Surveys, the Nspec and Area totals, and for every
+        measure and quantile q a column such as 'Nspec p50'.
+        """
+        by = list(by)
+        axes = [DIMENSIONS.index(dim) for dim in by]
+        columns = by + ['Surveys', *TOTALS] + [f'{m} p{q * 100:g}' for m in MEASURES for q in quantiles]
+        selected = np.flatnonzero(self.select(where))
+        if len(selected) == 0:
+            return pd.DataFrame(columns=columns)
+
+        if axes:
+            shape = [len(self.levels[axis]) for axis in axes]
+            groups, inverse = np.unique(np.ravel_multi_index(self.codes[selected][:, axes].T, shape),
+                                        return_inverse=True)
+        else:
+            groups, inverse = np.zeros(1, dtype=np.int64), np.zeros(len(selected), dtype=np.int64)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(groups)))
+        count = np.add.reduceat(self.count[selected][order], starts)
+        totals = np.add.reduceat(self.totals[selected][order], starts, axis=0)
+        hist = np.add.reduceat(self.hist[selected][order], starts, axis=0)
+        sums = np.add.reduceat(self.sums[selected][order], starts, axis=0)
+
+        data = {}
+        if axes:
+            for dim, axis, codes in zip(by, axes, np.unravel_index(groups, shape)):
+                data[dim] = [self.levels[axis][code] for code in codes]
+        data['Surveys'] = count
+        for total in TOTALS:
+            data[total] = totals[:, MEASURES.index(total)]
+        for m, measure in enumerate(MEASURES):
+            for q in quantiles:
+                data[f'{measure} p{q * 100:g}'] = histogram_quantiles(hist[:, m], sums[:, m], q)
+        return pd.DataFrame(data, columns=columns)
@@ -0,0 +1,223 @@
+""" Read-only JSON API over the survey catalogue.
+
+GET /api/surveys          filtered, projected, sorted and paginated list of surveys
+GET /api/surveys/<id>     one survey, by source file name (e.g. 'GAMA') or Survey name
+GET /api/summary          totals and quantiles by facility, wavelength, status and/or selection type
+
+The list endpoint takes the dashboard filters (see filters.parse_filter_args) plus
+
+    fields=Survey,Nspec,Density   only return these fields ('id' is always included)
+    q=spectroscopic redshift      free-text search (see search.py), best matches first unless sorted
+    sort=-Nspec,Survey            sort order, '-' for descending (default: catalogue order)
+    limit=100                     page size (at most MAX_LIMIT)
+    cursor=...                    'next_cursor' from the previous page
+
+The summary endpoint reads the catalogue's aggregate cube (aggregates.py) and takes
+
+    by=Facility,Survey Status     dimensions to group by (default: one overall total)
+    status, facility, wavelength, selection_type   restrict the surveys counted (repeatable)
+
+Records are built once per catalogue version and served from memory, and every
+response supports conditional GET through ETag/Last-Modified.
+"""
+import base64
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import Response, request
+from werkzeug.http import http_date, is_resource_modified
+
+from aggregates import DIMENSIONS
+from export import export_etag
+from filters import parse_filter_args, split_values
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_SORT_ORDERS = 32
+
+
+class ApiIndex:
+    """ JSON-ready records, id lookups and cached sort orders for one Catalogue. """
+
+    def __init__(self, catalogue):
+        self.catalogue = catalogue
+        frame = catalogue.frame
+        self.ids = [os.path.splitext(source)[0] for source in catalogue.sources]
+        self.fields = ['id'] + list(frame.columns)
+        columns = {'id': self.ids}
+        for column in frame.columns:
+            values = frame[column].tolist()
+            # NaN is not valid JSON
+            columns[column] = [None if isinstance(v, float) and v != v else v for v in values]
+        self.records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+        self.by_id = {id_.lower(): i for i, id_ in enumerate(self.ids)}
+        self.by_name = {}
+        for i, name in enumerate(columns['Survey']):
+            self.by_name.setdefault(str(name).lower(), []).append(i)
+        self._sort_ranks = {}
+        self._lock = threading.Lock()
+
+    def sort_rank(self, sort):
+        """ Rank of every row under a sort spec such as ('-Nspec', 'Survey'). """
+        with self._lock:
+            rank = self._sort_ranks.get(sort)
+        if rank is not None:
+            return rank
+        keys = [key.lstrip('-') for key in sort]
+        unknown = [key for key in keys if key not in self.fields]
+        if unknown:
+            raise ValueError(f"cannot sort on unknown field(s) {unknown}")
+        frame = self.catalogue.frame.assign(id=self.ids).reset_index(drop=True)
+        order = frame.sort_values(keys, ascending=[not key.startswith('-') for key in sort],
+                                  kind='stable', na_position='last').index.to_numpy()
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        with self._lock:
+            if len(self._sort_ranks) >= MAX_SORT_ORDERS:
+                self._sort_ranks.pop(next(iter(self._sort_ranks)))
+            self._sort_ranks[sort] = rank
+        return rank
+
+    def project(self, rows, fields):
+        if fields is None:
+            return [self.records[i] for i in rows]
+        return [{field: self.records[i][field] for field in fields} for i in rows]
+
+    def lookup(self, key):
+        """ Row positions matching a survey id, or failing that a Survey name. """
+        key = key.lower()
+        if key in self.by_id:
+            return [self.by_id[key]]
+        return self.by_name.get(key, [])
+
+
+def encode_cursor(version, offset):
+    return base64.urlsafe_b64encode(json.dumps([version, offset]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        version, offset = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        version, offset = str(version), int(offset)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor") from None
+    # A negative offset would give an empty page that points back at itself
+    if offset < 0:
+        raise ValueError("invalid cursor")
+    return version, offset
+
+
+def json_response(data, status=200, headers=None):
+    return Response(json.dumps(data, ensure_ascii=False), status=status, headers=headers,
+                    mimetype='application/json')
+
+
+def register_api(server, catalogue_store):
+    """ Add the /api/surveys routes to the Flask server. """
+    indexes = {}
+    lock = threading.Lock()
+
+    def current_index():
+        cat = catalogue_store.current
+        index = indexes.get(cat.version)
+        if index is None:
+            with lock:
+                index = indexes.get(cat.version)
+                if index is None:
+                    index = ApiIndex(cat)
+                    indexes.clear()
+                    indexes[cat.version] = index
+        return index
+
+    def conditional(index, *key, kind='api'):
+        """ (headers, not_modified) for this request against the index's catalogue. """
+        cat = index.catalogue
+        etag = export_etag(cat.version, kind, {'key': list(key)})
+        modified = datetime.fromtimestamp(int(cat.modified), timezone.utc)
+        headers = {'ETag': f'"{etag}"', 'Last-Modified': http_date(modified), 'Cache-Control': 'no-cache'}
+        return headers, not is_resource_modified(request.environ, etag=etag, last_modified=modified)
+
+    def list_surveys():
+        index = current_index()
+        cat = index.catalogue
+        try:
+            query = parse_filter_args(request.args)
+            fields = request.args.get('fields')
+            if fields is not None:
+                fields = ['id'] + [f.strip() for f in fields.split(',') if f.strip() and f.strip() != 'id']
+                unknown = [f for f in fields if f not in index.fields]
+                if unknown:
+                    raise ValueError(f"unknown field(s) {unknown}")
+            sort = tuple(key.strip() for key in request.args.get('sort', '').split(',') if key.strip())
+            limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+            offset = 0
+            if 'cursor' in request.args:
+                version, offset = decode_cursor(request.args['cursor'])
+                if version != cat.version:
+                    return json_response({'error': "the catalogue has changed since this cursor was issued, "
+                                                   "start again without a cursor", 'version': cat.version}, 409)
+            rank = index.sort_rank(sort) if sort else None
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        headers, not_modified = conditional(index, sorted(request.args.items(multi=True)))
+        if not_modified:
+            return Response(status=304, headers=headers)
+
+        rows = cat.query(**query)
+        if rank is not None:
+            rows = rows[np.argsort(rank[rows], kind='stable')]
+        elif query['search']:
+            rows = cat.search.ranked(query['search'], rows)
+        page = rows[offset:offset + limit]
+        next_offset = offset + len(page)
+        return json_response({
+            'version': cat.version,
+            'count': int(len(rows)),
+            'surveys': index.project(page, fields),
+            'next_cursor': encode_cursor(cat.version, next_offset) if next_offset < len(rows) else None,
+        }, headers=headers)
+
+    def get_survey(survey):
+        index = current_index()
+        headers, not_modified = conditional(index, survey.lower())
+        if not_modified:
+            return Response(status=304, headers=headers)
+        rows = index.lookup(survey)
+        if not rows:
+            return json_response({'error': f"no survey '{survey}'"}, 404)
+        if len(rows) > 1:
+            return json_response({'error': f"'{survey}' is ambiguous, use one of the ids",
+                                  'ids': [index.ids[i] for i in rows]}, 409)
+        return json_response(index.records[rows[0]], headers=headers)
+
+    def summary():
+        # One catalogue for both the ETag and the body, even if a reload happens in between
+        index = current_index()
+        cat = index.catalogue
+        try:
+            by = split_values(request.args, 'by') or []
+            unknown = [dim for dim in by if dim not in DIMENSIONS]
+            if unknown:
+                raise ValueError(f"cannot group by {unknown}, expected some of {list(DIMENSIONS)}")
+            where = {'Survey Status': split_values(request.args, 'status'),
+                     'Facility': split_values(request.args, 'facility', sep=None),
+                     'Selection Wavelength': split_values(request.args, 'wavelength'),
+                     'Selection Type': split_values(request.args, 'selection_type')}
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        headers, not_modified = conditional(index, sorted(request.args.items(multi=True)), kind='summary')
+        if not_modified:
+            return Response(status=304, headers=headers)
+        table = cat.cube.rollup(by, where)
+        groups = [{key: None if isinstance(value, float) and value != value else value
+                   for key, value in record.items()} for record in table.to_dict('records')]
+        return json_response({'version': cat.version, 'by': by, 'groups': groups}, headers=headers)
+
+    server.add_url_rule('/api/surveys', 'api_surveys', list_surveys)
+    server.add_url_rule('/api/surveys/<survey>', 'api_survey', get_survey)
+    server.add_url_rule('/api/summary', 'api_summary', summary)
@@ -1,38 +1,35 @@
-from dash import Dash, dcc, html, Input, Output, exceptions, callback_context
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction, callback_context, no_update
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
-import plotly.express as px
-import pandas as pd
 import numpy as np
-import glob
+import hmac
+import json
+import logging
+from flask import request
 
-max_area = 41252.96 # 4pi steradians in deg^2
-area_range = np.logspace(-2, np.log10(max_area), 100)
-ntotal = [1000, 1e4, 1e5, 1e6, 1e7, 1e8]
-density = [nt / area_range for nt in ntotal]
+from aggregates import selection_types
+from catalogue import CatalogueStore, status_types
+from figure_cache import FigureCache, filter_key
+from filters import nspec_threshold
+from search import query_terms
+from figures import (build_base_figure, figure_update, full_figure, figure_patch, compact_update, full_compact_figure,
+                     compact_patch, compact_catalogue, merge_viewport, summary_figure)
+from api import register_api
+from export import register_export, available_formats
+from metrics import register_metrics
+from compression import register_compression
+from settings import (CLIENTSIDE_FILTERING, COMPACT_FIGURES, COMPRESS_RESPONSES, RELOAD_INTERVAL, RELOAD_TOKEN,
+                      WEBGL_THRESHOLD)
 
-surveys_jsons = glob.glob('surveys/*.json')
-surveys_jsons.sort()
-surveys_df = [pd.read_json(survey, typ='series') for survey in surveys_jsons]
-df = pd.concat(surveys_df, axis=1, join='outer').transpose()
-
-### Prepare the data
-df['Density'] = df['Nspec'] / df['Area']
-
-status_types = np.array(['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished'])
-df['Survey Status'] = status_types[np.array(df['Status'], dtype=np.int32)]
-
-wlcolm_new = {'X-ray': 0, 'UV': 1, # X-ray-UV
-              '300-500nm': 2, '500-950nm': 3, # Optical Range
-              '0.95-2.5µm': 4, '2.5-5µm': 5, '5-1000µm': 6, # IR Ranges
-              'Radio': 7, # mm-Radio
-              }
+logging.basicConfig(level=logging.INFO)
 
 ### Prepare the facilities data
-collect_facilities = np.unique(df['Facility'])
 space_based = ['HST', 'JWST', 'Euclid', 'Roman']
-location = ['Ground-based' if facility not in space_based else 'Space-based' for facility in collect_facilities]
-facility_data = [{"value": facility, "label": facility, "group": loc} for facility, loc in zip(collect_facilities, location)]
+
+def facility_options(catalogue):
+    collect_facilities = catalogue.facilities
+    location = ['Ground-based' if facility not in space_based else 'Space-based' for facility in collect_facilities]
+    return [{"value": facility, "label": facility, "group": loc} for facility, loc in zip(collect_facilities, location)]
 
 ### Prepare the layout
 config = {
@@ -47,327 +44,264 @@ config = {
   'modeBarButtonsToRemove': ['lasso2d', 'select2d'],
 }
 
-""" App Code """
-app = Dash(__name__)
-server = app.server
-
-app.layout = html.Div([
-    # Add Google Fonts link for Roboto
-    html.Link(
-        rel='stylesheet',
-        href='https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap'
-    ),
-    dmc.MantineProvider(
-    html.Div([
-    dmc.Container([
-    dmc.Group([
-        DashIconify(icon="streamline-plump:galaxy-2-solid", width=52, height=52, color="#2d5c99"),
-        dmc.Title('Galaxy and Cosmology Spectroscopic Surveys', order=2, 
-                  style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '100'})
-    ], align='center', spacing='md', mb=10, style={'justify-content': 'center'}),
-    html.Div([
-        dcc.Graph(id="scatter-plot", mathjax=True, config=config)
-    ], style={'display': 'flex', 'justify-content': 'center', 'align-items': 'center'}),
-    dmc.Container([
-        dmc.Text("Minimum Number of Spectra (Nspec)", size="sm", weight=500, mb=5, align="center",
-                 style={'fontFamily': 'Roboto, sans-serif'}),
+export_labels = {'csv': 'CSV', 'jsonl': 'JSON Lines', 'parquet': 'Parquet', 'votable': 'VOTable'}
+
+def build_layout(catalogue, client_data=None):
+    facility_data = facility_options(catalogue)
+
+    return html.Div([
+        # Add Google Fonts link for Roboto
+        html.Link(
+            rel='stylesheet',
+            href='https://fonts.googleapis.com/css2?family=Roboto:wght@300;400;500;700&display=swap'
+        ),
+        dmc.MantineProvider(
         html.Div([
-            dmc.Group([
-                html.Div([
-                    dcc.Slider(
-                        id='nspec-slider',
-                        min=3,  # 10^3
-                        max=8,  # 10^8
-                        step=0.1,
-                        value=4.699,  # Default to 10^4.699 = 50000
-                        marks={3: '10³', 4: '10⁴', 5: '10⁵', 6: '10⁶', 7: '10⁷', 8: '10⁸'},
-                        tooltip={"placement": "bottom", "always_visible": False},
-                        updatemode='mouseup'
-                    )
-                ], style={'width': '400px'}),
-                dmc.NumberInput(
-                    id='nspec-input',
-                    value=50000,
-                    min=1000,
-                    max=100000000,
-                    step=1000,
-                    placeholder="Enter min Nspec",
-                    style={'width': '150px'},
-                    stepHoldDelay=500,
-                    stepHoldInterval=100
-                )
-            ], align='center', spacing='md')
-        ], style={'display': 'flex', 'justify-content': 'center'})
-    ], mb=20),
-    dmc.Flex([
-    dmc.Popover(
-        width=300,
-        position="bottom",
-        withArrow=True,
-        zIndex=2000,
-        shadow="md",
-        children=[
-            dmc.PopoverTarget(dmc.Button("Facilities", leftIcon=DashIconify(icon="solar:telescope-linear"), 
-                                         variant="light", color="indigo", 
-                                         style={'fontFamily': 'Roboto, sans-serif'})),
-            dmc.PopoverDropdown(
-                dmc.MultiSelect(
-                    label="Limit to specific facilities/telescopes",
-                    placeholder="Pick facilities",
-                    data=facility_data,
-                    id="facility",
-                    value=[],
-                    searchable=True,
-                    nothingFound="No options found",
-                    style={'fontFamily': 'Roboto, sans-serif'}
-                )
-            ),
-        ],
-    ),
-    dmc.Popover(
-        width=400,
-        position="bottom",
-        withArrow=True,
-        zIndex=2000,
-        shadow="md",
-        children=[
-            dmc.PopoverTarget(dmc.Button("Spectral Resolution", leftIcon=DashIconify(icon="iconoir:microscope"), 
-                                         variant="light", color="violet",
-                                         style={'fontFamily': 'Roboto, sans-serif'})),
-            dmc.PopoverDropdown(
-                html.Div([
-                    html.Label("Spectral Resolution (R)", style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', 'marginBottom': '20px', 'display': 'block'}),
-                    dcc.RangeSlider(
-                        id="resolution",
-                        min=0,
-                        max=7000,
-                        step=100,
-                        value=[0, 7000],  # Default to full range
-                        marks={
-                            1000: '1K',
-                            3000: '3K',
-                            5000: '5K',
-                            7000: '7K'
-                        },
-                        tooltip={"placement": "bottom", "always_visible": False},
-                        updatemode='mouseup'
-                    ),
-                    html.P([
-                        html.I("If unavailable, spectral resolution uses a default value of 1000.",
-                                style={'fontFamily': 'Roboto, sans-serif', 'fontSize': '12px'})
-                    ]),
-                ], style={'padding': '15px', 'width': '350px'})
+        dmc.Container([
+        dmc.Group([
+            DashIconify(icon="streamline-plump:galaxy-2-solid", width=52, height=52, color="#2d5c99"),
+            dmc.Title('Galaxy and Cosmology Spectroscopic Surveys', order=2, 
+                      style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '100'})
+        ], align='center', spacing='md', mb=10, style={'justify-content': 'center'}),
+        dmc.Container([
+            dmc.TextInput(
+                id='search',
+                placeholder="Search surveys, facilities, instruments and notes",
+                icon=DashIconify(icon="iconoir:search"),
+                value='',
+                debounce=150,
+                style={'fontFamily': 'Roboto, sans-serif'}
             ),
-        ],),
-    dmc.Popover(
-        width=300,
-        position="bottom",
-        withArrow=True,
-        zIndex=2000,
-        shadow="md",
-        children=[
-            dmc.PopoverTarget(dmc.Button("Survey status", leftIcon=DashIconify(icon="iconoir:timer"), 
-                                         variant="light", color="orange",
-                                         style={'fontFamily': 'Roboto, sans-serif'})),
-            dmc.PopoverDropdown(
-                dmc.CheckboxGroup(
-                            id="status",
-                            label="Survey status",
-                            #mb=10,
-                            children=html.Div(
-                                [
-                                    dmc.Checkbox(label="Complete", value="Complete"),
-                                    dmc.Checkbox(label="Ongoing", value="Ongoing"),
-                                    dmc.Checkbox(label="Proposed / Planned", value="Proposed / Planned"),
-                                    dmc.Checkbox(label="Special / Unfinished", value="Special / Unfinished"),
-                                ],
-                                style={"display": "flex", "flexDirection": "column"},
-                            ),
-                            value=['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished'],
+            # Best matches for the search, kept up to date by show_search_results
+            html.Div(id='search-results', style={'marginTop': '5px'}),
+        ], size=500, mb=10),
+        html.Div([
+            dcc.Graph(id="scatter-plot", mathjax=True, config=config)
+        ], style={'display': 'flex', 'justify-content': 'center', 'align-items': 'center'}),
+        dmc.Container([
+            dmc.Text("Minimum Number of Spectra (Nspec)", size="sm", weight=500, mb=5, align="center",
+                     style={'fontFamily': 'Roboto, sans-serif'}),
+            html.Div([
+                dmc.Group([
+                    html.Div([
+                        dcc.Slider(
+                            id='nspec-slider',
+                            min=3,  # 10^3
+                            max=8,  # 10^8
+                            step=0.1,
+                            value=4.699,  # Default to 10^4.699 = 50000
+                            marks={3: '10³', 4: '10⁴', 5: '10⁵', 6: '10⁶', 7: '10⁷', 8: '10⁸'},
+                            tooltip={"placement": "bottom", "always_visible": False},
+                            updatemode='mouseup'
+                        )
+                    ], style={'width': '400px'}),
+                    dmc.NumberInput(
+                        id='nspec-input',
+                        value=50000,
+                        min=1000,
+                        max=100000000,
+                        step=1000,
+                        placeholder="Enter min Nspec",
+                        style={'width': '150px'},
+                        stepHoldDelay=500,
+                        stepHoldInterval=100
+                    )
+                ], align='center', spacing='md')
+            ], style={'display': 'flex', 'justify-content': 'center'})
+        ], mb=20),
+        dmc.Flex([
+        dmc.Popover(
+            width=300,
+            position="bottom",
+            withArrow=True,
+            zIndex=2000,
+            shadow="md",
+            children=[
+                dmc.PopoverTarget(dmc.Button("Facilities", leftIcon=DashIconify(icon="solar:telescope-linear"), 
+                                             variant="light", color="indigo", 
+                                             style={'fontFamily': 'Roboto, sans-serif'})),
+                dmc.PopoverDropdown(
+                    dmc.MultiSelect(
+                        label="Limit to specific facilities/telescopes",
+                        placeholder="Pick facilities",
+                        data=facility_data,
+                        id="facility",
+                        value=[],
+                        searchable=True,
+                        nothingFound="No options found",
+                        style={'fontFamily': 'Roboto, sans-serif'}
+                    )
+                ),
+            ],
+        ),
+        dmc.Popover(
+            width=400,
+            position="bottom",
+            withArrow=True,
+            zIndex=2000,
+            shadow="md",
+            children=[
+                dmc.PopoverTarget(dmc.Button("Spectral Resolution", leftIcon=DashIconify(icon="iconoir:microscope"), 
+                                             variant="light", color="violet",
+                                             style={'fontFamily': 'Roboto, sans-serif'})),
+                dmc.PopoverDropdown(
+                    html.Div([
+                        html.Label("Spectral Resolution (R)", style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500', 'marginBottom': '20px', 'display': 'block'}),
+                        dcc.RangeSlider(
+                            id="resolution",
+                            min=0,
+                            max=7000,
+                            step=100,
+                            value=[0, 7000],  # Default to full range
+                            marks={
+                                1000: '1K',
+                                3000: '3K',
+                                5000: '5K',
+                                7000: '7K'
+                            },
+                            tooltip={"placement": "bottom", "always_visible": False},
+                            updatemode='mouseup'
                         ),
-            ),
-        ],),
-    dmc.Button("Download datapoints", leftIcon=DashIconify(icon="iconoir:download-circle-solid"), 
-               variant="light", color="green", id="btn-download-csv",
-               style={'fontFamily': 'Roboto, sans-serif'}),
-    dcc.Download(id="download-dataframe-csv"),
-    dmc.HoverCard(
-            shadow="md", width=200, position="bottom",
-            children=[dmc.HoverCardTarget(dmc.Avatar(DashIconify(icon="iconoir:info-circle", width=30), variant="gradient",
-            gradient={"from": "lime", "to": "orange", "deg": 0}, size=35, radius="xl")),
-                      dmc.HoverCardDropdown([
-                        dmc.Text("Developed and maintained by Kenneth Duncan", align="center",
-                                style={'fontFamily': 'Roboto, sans-serif'}),
-                        dmc.Group(
-                            [
-                                dmc.Anchor(
-                                    DashIconify(icon="iconoir:www", width=35),
-                                    href="https://dunkenj.github.io/", color="#7D3C98",
-                                    target="_blank",
-                                ),
-                                dmc.Anchor(
-                                    DashIconify(icon="iconoir:github-circle", width=35),
-                                    href="https://www.github.com/dunkenj/", color="#7D3C98",
-                                    target="_blank",
-                                ),
-                                dmc.Anchor(
-                                    DashIconify(icon="fa6-brands:orcid", width=35),
-                                    href="https://orcid.org/0000-0001-6889-8388", color="#7D3C98",
-                                    target="_blank",
+                        html.P([
+                            html.I("If unavailable, spectral resolution uses a default value of 1000.",
+                                    style={'fontFamily': 'Roboto, sans-serif', 'fontSize': '12px'})
+                        ]),
+                    ], style={'padding': '15px', 'width': '350px'})
+                ),
+            ],),
+        dmc.Popover(
+            width=300,
+            position="bottom",
+            withArrow=True,
+            zIndex=2000,
+            shadow="md",
+            children=[
+                dmc.PopoverTarget(dmc.Button("Survey status", leftIcon=DashIconify(icon="iconoir:timer"), 
+                                             variant="light", color="orange",
+                                             style={'fontFamily': 'Roboto, sans-serif'})),
+                dmc.PopoverDropdown(
+                    dmc.CheckboxGroup(
+                                id="status",
+                                label="Survey status",
+                                #mb=10,
+                                children=html.Div(
+                                    [
+                                        dmc.Checkbox(label="Complete", value="Complete"),
+                                        dmc.Checkbox(label="Ongoing", value="Ongoing"),
+                                        dmc.Checkbox(label="Proposed / Planned", value="Proposed / Planned"),
+                                        dmc.Checkbox(label="Special / Unfinished", value="Special / Unfinished"),
+                                    ],
+                                    style={"display": "flex", "flexDirection": "column"},
                                 ),
-                            ],
-                            p=0, position="center", align="center",
-                        ),
-                    ]),
+                                value=['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished'],
+                            ),
+                ),
+            ],),
+        dmc.Menu(
+            position="bottom",
+            withArrow=True,
+            zIndex=2000,
+            shadow="md",
+            children=[
+                dmc.MenuTarget(dmc.Button("Download datapoints", leftIcon=DashIconify(icon="iconoir:download-circle-solid"),
+                                          variant="light", color="green", id="btn-download",
+                                          style={'fontFamily': 'Roboto, sans-serif'})),
+                # Links to the /export route, kept in step with the filters by update_download_links
+                dmc.MenuDropdown([
+                    dmc.MenuItem(export_labels[fmt], id=f"download-{fmt}", href=f"/export/{fmt}", refresh=True)
+                    for fmt in available_formats()
                 ]),
-    ], direction='row', align='center', justify='center', gap='md'),
-    html.Div([
-        html.Br(),  # Proper line break
-        html.H3("Notes", style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500'}),
-        html.Div(
-            [
-                html.P("Hover over points to see survey details, including notes on selection criteria and references. Click on a point to open the reference in a new tab.",
-                       style={'fontFamily': 'Roboto, sans-serif'}),
-                html.P(["Additional surveys can be added by submitting a pull request with a .json file following the ",
-                        dmc.Anchor("format used in this project", href="https://github.com/dunkenj/SpecSurveysDB/tree/main/surveys"), 
-                        ". Incomplete/incorrect information can be also added by submitting a ",
-                        dmc.Anchor("GitHub issue.", href="https://github.com/dunkenj/SpecSurveysDB/issues/new"), ],
-                        style={'fontFamily': 'Roboto, sans-serif'}),
             ],
-            style={'margin-top': '10px'}
+        ),
+        dmc.HoverCard(
+                shadow="md", width=200, position="bottom",
+                children=[dmc.HoverCardTarget(dmc.Avatar(DashIconify(icon="iconoir:info-circle", width=30), variant="gradient",
+                gradient={"from": "lime", "to": "orange", "deg": 0}, size=35, radius="xl")),
+                          dmc.HoverCardDropdown([
+                            dmc.Text("Developed and maintained by Kenneth Duncan", align="center",
+                                    style={'fontFamily': 'Roboto, sans-serif'}),
+                            dmc.Group(
+                                [
+                                    dmc.Anchor(
+                                        DashIconify(icon="iconoir:www", width=35),
+                                        href="https://dunkenj.github.io/", color="#7D3C98",
+                                        target="_blank",
+                                    ),
+                                    dmc.Anchor(
+                                        DashIconify(icon="iconoir:github-circle", width=35),
+                                        href="https://www.github.com/dunkenj/", color="#7D3C98",
+                                        target="_blank",
+                                    ),
+                                    dmc.Anchor(
+                                        DashIconify(icon="fa6-brands:orcid", width=35),
+                                        href="https://orcid.org/0000-0001-6889-8388", color="#7D3C98",
+                                        target="_blank",
+                                    ),
+                                ],
+                                p=0, position="center", align="center",
+                            ),
+                        ]),
+                    ]),
+        ], direction='row', align='center', justify='center', gap='md'),
+        html.Div([
+            html.Br(),
+            html.H3("Summary", style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500'}),
+            dmc.Group([
+                dmc.SegmentedControl(id='summary-by', value='Facility', size='xs',
+                                     data=[{'value': dim, 'label': label} for dim, label in summary_dimensions.items()]),
+                dmc.SegmentedControl(id='summary-measure', value='Nspec', size='xs',
+                                     data=[{'value': 'Nspec', 'label': 'Spectra'}, {'value': 'Area', 'label': 'Area'},
+                                           {'value': 'Surveys', 'label': 'Surveys'}]),
+            ], position='center', spacing='md'),
+            dcc.Graph(id='summary-chart', config={'displaylogo': False}),
+            html.Div(id='summary-table'),
+            html.P(html.I("Totals over all surveys with the selected statuses and facilities; the Nspec, resolution and search filters are not applied.",
+                          style={'fontFamily': 'Roboto, sans-serif', 'fontSize': '12px'})),
+        ]),
+        html.Div([
+            html.Br(),  # Proper line break
+            html.H3("Notes", style={'fontFamily': 'Roboto, sans-serif', 'fontWeight': '500'}),
+            html.Div(
+                [
+                    html.P("Hover over points to see survey details, including notes on selection criteria and references. Click on a point to open the reference in a new tab.",
+                           style={'fontFamily': 'Roboto, sans-serif'}),
+                    html.P(["Additional surveys can be added by submitting a pull request with a .json file following the ",
+                            dmc.Anchor("format used in this project", href="https://github.com/dunkenj/SpecSurveysDB/tree/main/surveys"), 
+                            ". Incomplete/incorrect information can be also added by submitting a ",
+                            dmc.Anchor("GitHub issue.", href="https://github.com/dunkenj/SpecSurveysDB/issues/new"), ],
+                            style={'fontFamily': 'Roboto, sans-serif'}),
+                ],
+                style={'margin-top': '10px'}
+            )
+        ]),
+        ], size=800),
+        html.Div(id='dummy-output', style={'display': 'none'}),  # Hidden div for clientside callback
+        dcc.Store(id='catalogue-version', data=catalogue.version),  # Version the plot was drawn from
+        dcc.Store(id='plot-viewport'),  # Zoomed log-space view of the plot, None when unzoomed
+        # Client-side filtering mode: the whole catalogue, sent once with the page, and the
+        # catalogue positions matching the search
+        *([dcc.Store(id='catalogue-store', data=client_data), dcc.Store(id='search-matches')]
+          if client_data is not None else []),
+        ])
         )
-    ]),
-    ], size=800),
-    html.Div(id='dummy-output', style={'display': 'none'}),  # Hidden div for clientside callback
     ])
-    )
-])
-
-@app.callback(
-    Output("scatter-plot", "figure"),
-    [Input("status", "value"),
-     Input("facility", "value"),
-     Input("nspec-slider", "value"),
-     Input("resolution", "value")])
-def update_bar_chart(status_value, facility_list, min_nspec_log, resolution_range):
-
-    # Convert log scale to actual number
-    min_nspec = 10 ** min_nspec_log
-
-    include = df['Survey Status'].isin(status_value)
-    if len(facility_list) > 0:
-        include = include & df['Facility'].isin(facility_list)
-    
-    # Add Nspec filtering
-    include = include & (df['Nspec'] >= min_nspec)
-    
-    # Add resolution filtering with range slider
-    if resolution_range and len(resolution_range) == 2:
-        min_res, max_res = resolution_range
-        include = include & (df['Resolution'] >= min_res) & (df['Resolution'] <= max_res)
-
-    sort_id = [wlcolm_new[wlcolm] for wlcolm in df['Selection Wavelength']]
-    df['Sort ID'] = sort_id
-    df.sort_values(by=['Sort ID'], inplace=True)
-
-    # Use .loc for proper boolean indexing
-    filtered_df = df.loc[include]
-
-    fig = px.scatter(filtered_df, x="Area", y="Density", 
-                    log_x=True, log_y=True,
-                    #hover_data=['survey'],
-                    template="simple_white",
-                    color='Selection Wavelength',
-                    text='Survey',
-                    custom_data=['Full Name', 'Reference', 'Nspec', 'Area', 'Resolution', 'Survey Status', 'Notes'],
-                    color_discrete_sequence= px.colors.sequential.Magma_r,
-                    width=700, height=500)
-    # Add lines for constant Nspec
-    for nt, dens in zip(ntotal, density):
-        fig.add_scatter(x=area_range, y=dens,
-                        mode='lines',
-                        line=dict(color='#B5B5B5', width=2, dash="dash"),
-                        showlegend=False,
-                        name=f"n={nt}", zorder=0)
-
-    # Update hover template and marker size
-    fig.update_traces(hovertemplate = 
-                    r"<b>%{customdata[0]}</b><br>" +
-                    "Reference: %{customdata[1]}<br>" +
-                    "Status: <i>%{customdata[5]}</i><br><br>" +
-                    r"N<sub>spec</sub> = %{customdata[2]:,.2s} over %{customdata[3]:,.2r} deg²<br>" +
-                    r"Spectral Resolution: R ~ %{customdata[4]}<br>" +
-                    "Selection notes: %{customdata[6]}<br><br>" +
-                    "<i>Click to open reference</i>" +
-                    "<extra></extra>",
-                    textposition='bottom center',
-                    textfont_size=10,
-                    marker=dict(size=10,
-                                line=dict(width=1,
-                                            color='DarkSlateGrey')),
-                    selector=dict(mode='markers+text'))
-
-    # Fill non-physical sky areas
-    fig.add_vrect(x0=max_area, x1=100000, line_width=0, fillcolor="red", opacity=0.1)
-
-    # Calculate dynamic axis ranges based on filtered data
-    if len(filtered_df) > 0:
-        # Get min/max values from filtered data
-        min_area = filtered_df['Area'].min()
-        max_area_data = filtered_df['Area'].max()
-        min_density = filtered_df['Density'].min()
-        max_density = filtered_df['Density'].max()
-        
-        # Set lower limits to be a factor of 2 below the minimum values (in log space)
-        x_min = np.log10(min_area) - np.log10(2)  # Factor of 2 below minimum area
-        y_min = np.log10(min_density) - np.log10(2)  # Factor of 2 below minimum density
-        
-        # Set upper limits with some padding above maximum values
-        x_max = min(np.log10(max_area_data) + 0.5, 4.7)  # Keep original upper limit or extend
-        y_max = min(np.log10(max_density) + 0.5, 5.2)   # Keep original upper limit or extend
-
-        # Ensure reasonable minimum bounds
-        x_min = max(x_min, -2.0)  # Don't go below 0.01 deg²
-        y_min = max(y_min, -2.0)  # Don't go below 0.01 deg⁻²
-    else:
-        # If no data points, use default ranges
-        x_min, x_max = -1.2, 4.7
-        y_min, y_max = -1, 5.2
-
-    fig.update_layout(
-        #title="Galaxy and Cosmology Surveys",
-        yaxis_range=[y_min, y_max],
-        xaxis_range=[x_min, x_max],
-        xaxis_title=r"$$\mathsf{Survey\,area}\,(\mathsf{deg}^{\mathsf{2}})$$",
-        yaxis_title=r"$$\mathsf{Source\,density}\,(\mathsf{deg}^{\mathsf{-2}})$$",
-        font=dict(
-            family="Roboto, sans-serif",
-            size=14,
-            color="black"
-        ),
-        xaxis={'showgrid': True},
-        yaxis={'showgrid': True},
-        margin=dict(l=20, r=10, t=20, b=40),
-        legend=dict(title='Selection Wavelength:', orientation='v', y=0.02, x=0.02, 
-                    font=dict(size=10.5)),
-    )
-    fig.update_xaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
-                     showline=True, linewidth=1, linecolor='black', mirror=True,
-                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
-    fig.update_yaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
-                     showline=True, linewidth=1, linecolor='black', mirror=True,
-                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
 
-    return fig
+def filtered_rows(catalogue, status_value, facility_list, min_nspec_log, resolution_range, search=None):
+    # Convert log scale to actual number (the whole-number threshold used in the cache key)
+    return catalogue.query(status=status_value, facilities=facility_list, min_nspec=nspec_threshold(min_nspec_log),
+                           resolution=resolution_range, search=search)
+
+def build_figure_update(cat, status_value, facility_list, min_nspec_log, resolution_range, search=None,
+                        viewport=None):
+
+    rows = filtered_rows(cat, status_value, facility_list, min_nspec_log, resolution_range, search)
+
+    # Only the survey traces and axis ranges depend on the filters (and the view, for large result sets)
+    if COMPACT_FIGURES:
+        return compact_update(cat, rows, viewport)
+    return figure_update(cat.frame.iloc[rows], cat.wavelengths, viewport)
 
 # Callback to sync slider and number input
-@app.callback(
-    [Output("nspec-slider", "value"),
-     Output("nspec-input", "value")],
-    [Input("nspec-slider", "value"),
-     Input("nspec-input", "value")],
-    prevent_initial_call=True
-)
 def sync_nspec_inputs(slider_value, input_value):
     ctx = callback_context
     if not ctx.triggered:
@@ -388,74 +322,315 @@ def sync_nspec_inputs(slider_value, input_value):
     
     return slider_value, int(10 ** slider_value)
 
-@app.callback(
-    Output("download-dataframe-csv", "data"),
-    [Input("btn-download-csv", "n_clicks"),
-     Input("status", "value"),
-     Input("facility", "value"),
-     Input("nspec-slider", "value"),
-     Input("resolution", "value")],
-    prevent_initial_call=True,
-)
-def download_filtered_data(n_clicks, status_value, facility_list, min_nspec_log, resolution_range):
-    button_id = callback_context.triggered[0]['prop_id'].split('.')[0]
-
-    if button_id == "btn-download-csv":
-        if n_clicks is None:
-            raise exceptions.PreventUpdate
-
-        filtered_df = df.copy()
-        
-        # Convert log scale to actual number
-        min_nspec = 10 ** min_nspec_log
-
-        include = filtered_df['Survey Status'].isin(status_value)
-        if len(facility_list) > 0:
-            include = include & filtered_df['Facility'].isin(facility_list)
-        
-        # Add Nspec filtering
-        include = include & (filtered_df['Nspec'] >= min_nspec)
-        
-        # Add resolution filtering with range slider
-        if resolution_range and len(resolution_range) == 2:
-            min_res, max_res = resolution_range
-            include = include & (filtered_df['Resolution'] >= min_res) & (filtered_df['Resolution'] <= max_res)
-
-        # Use .loc for proper boolean indexing
-        filtered_df = filtered_df.loc[include]
-
-        return dcc.send_data_frame(filtered_df.to_csv, "surveys_data.csv")
+### Search results
+SEARCH_RESULTS = 5
+
+def search_results(catalogue, rows, search):
+    """ The number of surveys in `rows` matching the search and a list of the best few. """
+    matches = catalogue.search.ranked(search, rows)
+    if len(matches) == 0:
+        return dmc.Text("No surveys match the search with the current filters", size="sm", color="dimmed",
+                        style={'fontFamily': 'Roboto, sans-serif'})
+    frame = catalogue.frame.iloc[matches[:SEARCH_RESULTS]]
+    count = f"{len(matches)} matching survey{'s' if len(matches) != 1 else ''}"
+    return html.Div([
+        dmc.Text(count + (", best matches:" if len(matches) > SEARCH_RESULTS else ":"), size="sm", color="dimmed",
+                 style={'fontFamily': 'Roboto, sans-serif'}),
+        *[dmc.Text([html.B(survey), f" – {full_name} ({facility})"], size="sm", lineClamp=1,
+                   style={'fontFamily': 'Roboto, sans-serif'})
+          for survey, full_name, facility in zip(frame['Survey'], frame['Full Name'], frame['Facility'])],
+    ])
+
+### Summary charts and tables
+summary_dimensions = {'Facility': 'Facility', 'Selection Wavelength': 'Wavelength', 'Survey Status': 'Status',
+                      'Selection Type': 'Selection'}
+SUMMARY_TOP = 15  # facilities shown, the largest first
 
+def summary_groups(catalogue, totals, by, measure):
+    """ The values of `by` to show, in display order. """
+    natural = {'Selection Wavelength': catalogue.wavelengths, 'Survey Status': status_types,
+               'Selection Type': selection_types}
+    if by in natural:
+        present = set(totals[by])
+        return [value for value in natural[by] if value in present] + sorted(present - set(natural[by]))
+    return totals.sort_values(measure, ascending=False, kind='stable')[by].head(SUMMARY_TOP).tolist()
+
+def format_number(value):
+    if value != value:
+        return '–'
+    return f"{value:,.0f}" if abs(value) >= 100 else f"{value:.3g}"
+
+def summary_table(totals, by, groups):
+    header = [summary_dimensions[by], 'Surveys', 'Spectra', 'Area (deg²)', 'Median Nspec', 'Median area',
+              'Median density']
+    columns = ['Surveys', 'Nspec', 'Area', 'Nspec p50', 'Area p50', 'Density p50']
+    rows = totals.set_index(by).loc[groups]
+    return dmc.Table([
+        html.Thead(html.Tr([html.Th(name) for name in header])),
+        html.Tbody([html.Tr([html.Td(group)] + [html.Td(format_number(row[column])) for column in columns])
+                    for group, row in rows.iterrows()]),
+    ], striped=True, highlightOnHover=True, fontSize='xs', style={'fontFamily': 'Roboto, sans-serif'})
+
+def register_callbacks(app, catalogue_store, figure_cache, base_figure):
+    """ Plot, input-sync, search, summary, download-link and click callbacks. """
+
+    def draw_figure(cat, update):
+        if COMPACT_FIGURES:
+            return full_compact_figure(base_figure, cat, update)
+        return full_figure(base_figure, cat.wavelengths, update)
+
+    def patch_figure(update, with_ranges=True):
+        if COMPACT_FIGURES:
+            return compact_patch(update, with_ranges)
+        return figure_patch(update, with_ranges)
+
+    def update_bar_chart(status_value, facility_list, min_nspec_log, resolution_range, search, relayout_data,
+                         figure_version, viewport):
+        cat = catalogue_store.current
+        if callback_context.triggered_id == 'scatter-plot' and figure_version == cat.version:
+            return zoom_update(cat, status_value, facility_list, min_nspec_log, resolution_range, search,
+                               relayout_data, viewport)
+
+        key = filter_key(status_value, facility_list, min_nspec_log, resolution_range, cat.version, search)
+        update = figure_cache.get_or_build(
+            key, lambda: build_figure_update(cat, status_value, facility_list, min_nspec_log, resolution_range,
+                                             search))
+
+        # The first call for a page renders the whole figure, later ones only patch the survey data.
+        # A reloaded catalogue may have different trace slots, so it is always drawn in full.
+        # Either way the axes are reset to frame the filtered surveys.
+        if callback_context.triggered_id is None or figure_version != cat.version:
+            return draw_figure(cat, update), cat.version, None
+        return patch_figure(update), no_update, None
+
+    def zoom_update(cat, status_value, facility_list, min_nspec_log, resolution_range, search, relayout_data,
+                    viewport):
+        new_viewport = merge_viewport(viewport, relayout_data)
+        if new_viewport == viewport:
+            # Not a zoom or pan (autosize, drag mode, ...)
+            return no_update, no_update, no_update
+
+        rows = filtered_rows(cat, status_value, facility_list, min_nspec_log, resolution_range, search)
+        if len(rows) <= WEBGL_THRESHOLD:
+            # Already drawn in full detail
+            return no_update, no_update, new_viewport
+        if new_viewport is None:
+            key = filter_key(status_value, facility_list, min_nspec_log, resolution_range, cat.version, search)
+            update = figure_cache.get_or_build(
+                key, lambda: build_figure_update(cat, status_value, facility_list, min_nspec_log, resolution_range,
+                                                 search))
+        else:
+            update = build_figure_update(cat, status_value, facility_list, min_nspec_log, resolution_range,
+                                         search, new_viewport)
+        # Leave the axes where the user put them
+        return patch_figure(update, with_ranges=False), no_update, new_viewport
+
+    def update_summary(by, measure, status_value, facility_list):
+        # Rolled up from the aggregate cube: the cost depends on the number of populated
+        # facility/wavelength/status/selection cells, not on the number of surveys
+        cat = catalogue_store.current
+        where = {'Survey Status': status_value, 'Facility': facility_list or None}
+        totals = cat.cube.rollup([by], where)
+        if len(totals) == 0:
+            return summary_figure(totals, by, measure, []), []
+        groups = summary_groups(cat, totals, by, measure)
+        stacked = totals if by == 'Survey Status' else cat.cube.rollup([by, 'Survey Status'], where)
+        return summary_figure(stacked, by, measure, groups), summary_table(totals, by, groups)
+
+    def show_search_results(search, status_value, facility_list, min_nspec_log, resolution_range):
+        cat = catalogue_store.current
+        if not query_terms(search):
+            return ([], None) if CLIENTSIDE_FILTERING else []
+        rows = filtered_rows(cat, status_value, facility_list, min_nspec_log, resolution_range)
+        results = search_results(cat, rows, search)
+        if CLIENTSIDE_FILTERING:
+            # The browser filters the plot itself, it only needs to know which surveys match
+            return results, {'version': cat.version, 'rows': cat.search.matches(search).tolist()}
+        return results
+
+    filter_inputs = [Input("status", "value"),
+                     Input("facility", "value"),
+                     Input("nspec-slider", "value"),
+                     Input("resolution", "value")]
+    nspec_outputs = [Output("nspec-slider", "value"), Output("nspec-input", "value")]
+    nspec_inputs = [Input("nspec-slider", "value"), Input("nspec-input", "value")]
+    search_input = Input("search", "value")
+
+    if CLIENTSIDE_FILTERING:
+        # Filter and redraw in the browser (assets/clientside.js): no server round-trips, except
+        # for searches, which the server's index answers with the matching positions
+        app.clientside_callback(ClientsideFunction('specsurveys', 'filter_figure'),
+                                Output("scatter-plot", "figure"), filter_inputs + [Input("search-matches", "data")],
+                                State('catalogue-store', 'data'))
+        app.clientside_callback(ClientsideFunction('specsurveys', 'sync_nspec_inputs'),
+                                nspec_outputs, nspec_inputs, prevent_initial_call=True)
     else:
-        raise exceptions.PreventUpdate
+        # Zooming re-sends the surveys in view at full detail when the result set is large (see figures.figure_update)
+        app.callback([Output("scatter-plot", "figure"), Output("catalogue-version", "data"), Output("plot-viewport", "data")],
+                     filter_inputs + [search_input, Input("scatter-plot", "relayoutData")],
+                     [State("catalogue-version", "data"), State("plot-viewport", "data")])(update_bar_chart)
+        app.callback(nspec_outputs, nspec_inputs, prevent_initial_call=True)(sync_nspec_inputs)
 
-# Clientside callback to handle click events and open references
-app.clientside_callback(
-    """
-    function(clickData) {
-        if (clickData && clickData.points && clickData.points.length > 0) {
-            var point = clickData.points[0];
-            if (point.customdata && point.customdata[1]) {
-                var reference = point.customdata[1];
-                // Check if reference contains a DOI or URL
-                if (reference.startsWith('10.')) {
-                    // It's a DOI, construct URL
-                    var url = 'https://doi.org/' + reference;
-                } else if (reference.startsWith('http')) {
-                    // It's already a URL
-                    var url = reference;
-                } else {
-                    // For other cases, try to construct DOI URL
-                    var url = 'https://doi.org/' + reference;
+    app.callback([Output("summary-chart", "figure"), Output("summary-table", "children")],
+                 [Input("summary-by", "value"), Input("summary-measure", "value"),
+                  Input("status", "value"), Input("facility", "value")])(update_summary)
+
+    if CLIENTSIDE_FILTERING:
+        search_outputs = [Output("search-results", "children"), Output("search-matches", "data")]
+    else:
+        search_outputs = Output("search-results", "children")
+    app.callback(search_outputs, [search_input] + filter_inputs)(show_search_results)
+
+    # Point the download links at /export with the current filters (same parameters as filters.parse_filter_args)
+    app.clientside_callback(
+        """
+        function(status, facilities, nspecLog, resolution, search) {
+            var params = new URLSearchParams();
+            params.append('status', (status || []).join(','));
+            (facilities || []).forEach(function(facility) { params.append('facility', facility); });
+            params.append('nspec', nspecLog);
+            if (resolution && resolution.length === 2) {
+                params.append('resolution', resolution.join(','));
+            }
+            if (search && search.trim()) {
+                params.append('q', search.trim());
+            }
+            var query = params.toString();
+            return FORMATS.map(function(fmt) { return '/export/' + fmt + '?' + query; });
+        }
+        """.replace('FORMATS', json.dumps(available_formats())),
+        [Output(f"download-{fmt}", "href") for fmt in available_formats()],
+        filter_inputs + [search_input],
+    )
+
+    # Clientside callback to handle click events and open references
+    app.clientside_callback(
+        """
+        function(clickData) {
+            if (clickData && clickData.points && clickData.points.length > 0) {
+                var point = clickData.points[0];
+                if (point.customdata && point.customdata[1]) {
+                    var reference = point.customdata[1];
+                    // Check if reference contains a DOI or URL
+                    if (reference.startsWith('10.')) {
+                        // It's a DOI, construct URL
+                        var url = 'https://doi.org/' + reference;
+                    } else if (reference.startsWith('http')) {
+                        // It's already a URL
+                        var url = reference;
+                    } else {
+                        // For other cases, try to construct DOI URL
+                        var url = 'https://doi.org/' + reference;
+                    }
+                    window.open(url, '_blank');
                 }
-                window.open(url, '_blank');
             }
+            return '';
         }
-        return '';
-    }
-    """,
-    Output('dummy-output', 'children'),  # Use proper dummy output
-    Input('scatter-plot', 'clickData')
-)
-
-app.run_server(host='0.0.0.0', port=10000) # Default port changed to 10000
+        """,
+        Output('dummy-output', 'children'),  # Use proper dummy output
+        Input('scatter-plot', 'clickData')
+    )
+
+""" App Code """
+def create_app(catalogue_store=None, watch=True):
+    """ Build the dashboard around a CatalogueStore (by default the 'surveys' directory).
+
+    watch=False leaves watching for changed survey files (SPECSURVEYS_RELOAD_INTERVAL) and reload
+    requests to the caller, e.g. gunicorn.conf.py starts the watcher in each worker after the fork.
+    """
+    # Compiled snapshot if up to date ('python catalogue.py'), otherwise the surveys/*.json files.
+    # Each Catalogue is immutable; callbacks take catalogue_store.current once and never modify it.
+    if catalogue_store is None:
+        catalogue_store = CatalogueStore()
+    # The static parts of the figure, built once
+    base_figure = build_base_figure(compact=COMPACT_FIGURES)
+
+    app = Dash(__name__)
+    server = app.server
+    server.extensions['catalogue_store'] = catalogue_store
+
+    # Figure updates keyed on (status, facilities, Nspec, resolution, catalogue version, search words)
+    figure_cache = FigureCache(maxsize=128, ttl=3600)
+
+    @server.route('/_figure-cache')
+    def figure_cache_stats():
+        return {**figure_cache.stats(), 'catalogue_version': catalogue_store.current.version}
+
+    # Entries for an old catalogue version can never be hit again
+    @catalogue_store.subscribe
+    def on_catalogue_change(catalogue):
+        figure_cache.clear()
+
+    @server.route('/_reload-catalogue', methods=['POST'])
+    def reload_catalogue():
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not RELOAD_TOKEN or not hmac.compare_digest(token, RELOAD_TOKEN):
+            return {'error': 'forbidden'}, 403
+        try:
+            catalogue = catalogue_store.reload()
+        except Exception as e:
+            return {'error': f'reload failed: {e}', 'version': catalogue_store.current.version}, 500
+        # This process is up to date; the other workers reload when their watchers see the trigger
+        catalogue_store.request_reload()
+        return {'reloaded': catalogue is not None, 'version': catalogue_store.current.version,
+                'surveys': len(catalogue_store.current.frame)}
+
+    # The watcher polls the survey files every RELOAD_INTERVAL seconds, and the reload trigger
+    # (touched by /_reload-catalogue in any worker) every second
+    if watch and (RELOAD_INTERVAL > 0 or RELOAD_TOKEN):
+        catalogue_store.watch(RELOAD_INTERVAL)
+
+    # Streaming downloads of the filtered catalogue: /export/<format>
+    register_export(server, catalogue_store)
+
+    # Read-only JSON API for scripts and pipelines: /api/surveys, /api/surveys/<id>
+    register_api(server, catalogue_store)
+
+    # Built once per catalogue version (and, when preloaded, before the workers fork), so a
+    # reloaded catalogue shows up in the facility list and client-side Store on the next page load
+    layouts = {}
+
+    def serve_layout():
+        catalogue = catalogue_store.current
+        layout = layouts.get(catalogue.version)
+        if layout is None:
+            client_data = compact_catalogue(catalogue, base_figure) if CLIENTSIDE_FILTERING else None
+            layout = build_layout(catalogue, client_data)
+            layouts.clear()
+            layouts[catalogue.version] = layout
+        return layout
+
+    # Validate callbacks against one rendered layout (Dash's own stripped-down clone breaks dmc components)
+    app.validation_layout = serve_layout()
+    app.layout = serve_layout
+
+    register_callbacks(app, catalogue_store, figure_cache, base_figure)
+
+    # gzip/brotli for callback responses, the layout and the Dash bundles (before metrics
+    # in the registration order, so the payload sizes are measured uncompressed)
+    if COMPRESS_RESPONSES:
+        register_compression(server)
+
+    # Prometheus metrics for every callback and route: /metrics
+    register_metrics(app, catalogue_store, figure_cache)
+    return app
+
+def create_server(**kwargs):
+    """ WSGI entry point ('gunicorn app:create_server()'): the Flask server of create_app(**kwargs). """
+    return create_app(**kwargs).server
+
+# For WSGI servers pointed at a module-level object ('gunicorn app:server'): the app is only
+# built when first asked for, so importing this module has no side effects
+_default_app = None
+
+def __getattr__(name):
+    global _default_app
+    if name not in ('app', 'server'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _default_app is None:
+        _default_app = create_app()
+    return _default_app if name == 'app' else _default_app.server
+
+if __name__ == '__main__':
+    create_app().run_server(host='0.0.0.0', port=10000) # Default port changed to 10000
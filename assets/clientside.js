@@ -0,0 +1,83 @@
+// Client-side versions of the plot callbacks, used when SPECSURVEYS_CLIENTSIDE_FILTERING is set.
+// The catalogue is sent once in the 'catalogue-store' Store (figures.compact_catalogue) and
+// filtering, trace building and axis ranges below mirror filters.py and figures.py.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    specsurveys: {
+        filter_figure: function(status, facilities, nspecLog, resolution, searchMatches, store) {
+            if (!store) {
+                return window.dash_clientside.no_update;
+            }
+            var cols = store.columns;
+            var statusSet = new Set(status || []);
+            var facilitySet = new Set(facilities || []);
+            // Whole-number threshold, as filters.nspec_threshold
+            var minNspec = Math.ceil(Math.pow(10, nspecLog) * (1 - 1e-12));
+            var useResolution = resolution && resolution.length === 2;
+            // Positions matching the search box, from the server's search index (show_search_results)
+            var matched = null;
+            if (searchMatches && searchMatches.version === store.version) {
+                matched = new Uint8Array(cols.slot.length);
+                searchMatches.rows.forEach(function(row) { matched[row] = 1; });
+            }
+
+            var traces = store.traces.map(function(template) {
+                return Object.assign({}, template, {x: [], y: [], text: [], customdata: [], showlegend: false, nspec: []});
+            });
+            var xMin = Infinity, xMax = -Infinity, yMin = Infinity, yMax = -Infinity, count = 0;
+            for (var i = 0; i < cols.slot.length; i++) {
+                if (!statusSet.has(store.statuses[cols.status[i]])) continue;
+                if (facilitySet.size > 0 && !facilitySet.has(store.facilities[cols.facility[i]])) continue;
+                if (!(cols.nspec[i] >= minNspec)) continue;
+                if (useResolution && !(cols.resolution[i] >= resolution[0] && cols.resolution[i] <= resolution[1])) continue;
+                if (matched && !matched[i]) continue;
+
+                var trace = traces[cols.slot[i]];
+                trace.x.push(cols.x[i]);
+                trace.y.push(cols.y[i]);
+                trace.text.push(cols.text[i]);
+                trace.customdata.push(cols.customdata[i]);
+                trace.showlegend = true;
+                trace.nspec.push(cols.nspec[i]);
+                xMin = Math.min(xMin, cols.x[i]); xMax = Math.max(xMax, cols.x[i]);
+                yMin = Math.min(yMin, cols.y[i]); yMax = Math.max(yMax, cols.y[i]);
+                count++;
+            }
+
+            // Large result sets: WebGL markers and labels for the surveys with the most spectra only,
+            // as in figures.figure_update (the browser already holds every point, so no decimation)
+            if (count > store.webgl_threshold) {
+                var nspecs = [].concat.apply([], traces.map(function(trace) { return trace.nspec; }));
+                nspecs.sort(function(a, b) { return b - a; });
+                var topN = store.label_top_n;
+                var labelNspec = nspecs.length <= topN ? -Infinity : (topN > 0 ? nspecs[topN - 1] : Infinity);
+                traces.forEach(function(trace) {
+                    trace.type = 'scattergl';
+                    trace.text = trace.text.map(function(text, j) { return trace.nspec[j] >= labelNspec ? text : ''; });
+                });
+            }
+            traces.forEach(function(trace) { delete trace.nspec; });
+
+            // Axis ranges as in figures.axis_ranges
+            var xRange = [-1.2, 4.7], yRange = [-1, 5.2];
+            if (count > 0) {
+                xRange = [Math.max(Math.log10(xMin) - Math.log10(2), -2.0), Math.min(Math.log10(xMax) + 0.5, 4.7)];
+                yRange = [Math.max(Math.log10(yMin) - Math.log10(2), -2.0), Math.min(Math.log10(yMax) + 0.5, 5.2)];
+            }
+
+            var layout = Object.assign({}, store.base.layout);
+            layout.xaxis = Object.assign({}, layout.xaxis, {range: xRange});
+            layout.yaxis = Object.assign({}, layout.yaxis, {range: yRange});
+            return {data: traces.concat(store.base.data), layout: layout};
+        },
+
+        sync_nspec_inputs: function(sliderValue, inputValue) {
+            // Mirrors the server-side sync_nspec_inputs callback
+            var triggered = window.dash_clientside.callback_context.triggered;
+            var triggerId = triggered.length > 0 ? triggered[0].prop_id.split('.')[0] : null;
+            if (triggerId === 'nspec-input' && inputValue && inputValue > 0) {
+                return [Math.log10(Math.max(1000, Math.min(inputValue, 100000000))), inputValue];
+            }
+            return [sliderValue, Math.floor(Math.pow(10, sliderValue))];
+        }
+    }
+});
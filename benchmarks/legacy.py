@@ -0,0 +1,82 @@
+""" The original (pre-optimisation) app code paths, kept as a fixed reference for benchmarks. """
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from dash import dcc
+
+from catalogue import status_types, wlcolm_new
+from figures import area_range, density, hovertemplate, max_area, ntotal
+
+
+def load_surveys(survey_dir):
+    """ glob + pd.read_json per file + concat/transpose, as app.py did at import. """
+    surveys_jsons = glob.glob(os.path.join(survey_dir, '*.json'))
+    surveys_jsons.sort()
+    surveys_df = [pd.read_json(survey, typ='series') for survey in surveys_jsons]
+    df = pd.concat(surveys_df, axis=1, join='outer').transpose()
+    df['Density'] = df['Nspec'] / df['Area']
+    df['Survey Status'] = np.array(status_types)[np.array(df['Status'], dtype=np.int32)]
+    return df
+
+
+def filter_mask(df, status_value, facility_list, min_nspec_log, resolution_range):
+    min_nspec = 10 ** min_nspec_log
+    include = df['Survey Status'].isin(status_value)
+    if len(facility_list) > 0:
+        include = include & df['Facility'].isin(facility_list)
+    include = include & (df['Nspec'] >= min_nspec)
+    if resolution_range and len(resolution_range) == 2:
+        min_res, max_res = resolution_range
+        include = include & (df['Resolution'] >= min_res) & (df['Resolution'] <= max_res)
+    return include
+
+
+def update_bar_chart(df, status_value, facility_list, min_nspec_log, resolution_range):
+    """ Mask, in-place sort and full px.scatter figure, as the original callback built them. """
+    include = filter_mask(df, status_value, facility_list, min_nspec_log, resolution_range)
+    sort_id = [wlcolm_new[wlcolm] for wlcolm in df['Selection Wavelength']]
+    df['Sort ID'] = sort_id
+    df.sort_values(by=['Sort ID'], inplace=True)
+    filtered_df = df.loc[include]
+
+    fig = px.scatter(filtered_df, x="Area", y="Density", log_x=True, log_y=True,
+                     template="simple_white", color='Selection Wavelength', text='Survey',
+                     custom_data=['Full Name', 'Reference', 'Nspec', 'Area', 'Resolution', 'Survey Status', 'Notes'],
+                     color_discrete_sequence=px.colors.sequential.Magma_r, width=700, height=500)
+    for nt, dens in zip(ntotal, density):
+        fig.add_scatter(x=area_range, y=dens, mode='lines', line=dict(color='#B5B5B5', width=2, dash="dash"),
+                        showlegend=False, name=f"n={nt}", zorder=0)
+    fig.update_traces(hovertemplate=hovertemplate, textposition='bottom center', textfont_size=10,
+                      marker=dict(size=10, line=dict(width=1, color='DarkSlateGrey')),
+                      selector=dict(mode='markers+text'))
+    fig.add_vrect(x0=max_area, x1=100000, line_width=0, fillcolor="red", opacity=0.1)
+    if len(filtered_df) > 0:
+        x_min = max(np.log10(filtered_df['Area'].min()) - np.log10(2), -2.0)
+        y_min = max(np.log10(filtered_df['Density'].min()) - np.log10(2), -2.0)
+        x_max = min(np.log10(filtered_df['Area'].max()) + 0.5, 4.7)
+        y_max = min(np.log10(filtered_df['Density'].max()) + 0.5, 5.2)
+    else:
+        x_min, x_max, y_min, y_max = -1.2, 4.7, -1, 5.2
+    fig.update_layout(yaxis_range=[y_min, y_max], xaxis_range=[x_min, x_max],
+                      xaxis_title=r"$$\mathsf{Survey\,area}\,(\mathsf{deg}^{\mathsf{2}})$$",
+                      yaxis_title=r"$$\mathsf{Source\,density}\,(\mathsf{deg}^{\mathsf{-2}})$$",
+                      font=dict(family="Roboto, sans-serif", size=14, color="black"),
+                      xaxis={'showgrid': True}, yaxis={'showgrid': True},
+                      margin=dict(l=20, r=10, t=20, b=40),
+                      legend=dict(title='Selection Wavelength:', orientation='v', y=0.02, x=0.02, font=dict(size=10.5)))
+    fig.update_xaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
+                     showline=True, linewidth=1, linecolor='black', mirror=True,
+                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
+    fig.update_yaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
+                     showline=True, linewidth=1, linecolor='black', mirror=True,
+                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
+    return fig
+
+
+def download_filtered_data(df, status_value, facility_list, min_nspec_log, resolution_range):
+    filtered_df = df.copy()
+    filtered_df = filtered_df.loc[filter_mask(filtered_df, status_value, facility_list, min_nspec_log, resolution_range)]
+    return dcc.send_data_frame(filtered_df.to_csv, "surveys_data.csv")
@@ -0,0 +1,434 @@
+""" Load test: the dashboard under gunicorn, driven by many concurrent simulated browser sessions.
+
+    python -m benchmarks.loadtest                               # sweep workers x threads on the real surveys
+    python -m benchmarks.loadtest --workers 1 2 4 --threads 1 4 --sessions 50 --duration 30
+    python -m benchmarks.loadtest --surveys 10000               # a synthetic catalogue (benchmarks.synthetic)
+    python -m benchmarks.loadtest --url http://127.0.0.1:10000  # an already running server, no sweep
+
+For every workers x threads combination gunicorn is started from 'gunicorn.conf.py' on a
+free local port. Each session then behaves like one browser tab. It loads the page and
+fires the initial callbacks. After that it keeps changing inputs (releasing the Nspec
+slider, dragging the resolution range, typing a search, toggling statuses and facilities,
+zooming and switching the summary view) with a random think time in between.
+
+Callbacks are replayed the way the Dash renderer sends them. The callbacks, their inputs
+and the initial property values are read from /_dash-dependencies and /_dash-layout. A
+change fires every server-side callback with a changed input. A callback waits for any
+other triggered callback whose outputs it reads, e.g. update_bar_chart waits for
+sync_nspec_inputs. Responses are requested gzipped, as a browser would.
+
+Throughput and p50/p95/p99 latency are reported for each callback, labelled by its first
+output, and in total. Results are written as JSON to benchmarks/results/loadtest-*.json.
+The client runs on the same machine as the server and takes CPU time from it, so compare
+runs made on the same host.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.run import RESULTS_DIR, git_commit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKERS = [1, 2, 4]
+DEFAULT_THREADS = [1, 4]
+START_TIMEOUT = 120
+HEADERS = {'Accept-Encoding': 'gzip', 'Content-Type': 'application/json'}
+
+STATUSES = ['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished']
+SEARCH_WORDS = ['galaxy', 'desi', 'sdss', 'redshift', 'lyman', 'quasar', 'cluster', 'euclid']
+SUMMARY_BY = ['Facility', 'Selection Wavelength', 'Survey Status', 'Selection Type']
+SUMMARY_MEASURES = ['Nspec', 'Area', 'Surveys']
+
+
+def create_server(survey_dir, snapshot_path):
+    """ WSGI entry point serving another survey directory (gunicorn 'benchmarks.loadtest:create_server(...)'). """
+    from app import create_app
+    from catalogue import CatalogueStore
+    return create_app(CatalogueStore(survey_dir, snapshot_path), watch=False).server
+
+
+### Dash client
+def parse_outputs(output):
+    """ [(id, property)] from a callback's output string ('..a.b...c.d..' or 'a.b'). """
+    if output.startswith('..'):
+        parts = output[2:-2].split('...')
+    else:
+        parts = [output]
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+
+def component_props(node, props):
+    """ Collect {(id, property): value} for every component with an id in a layout tree. """
+    if isinstance(node, list):
+        for item in node:
+            component_props(item, props)
+    elif isinstance(node, dict):
+        if 'props' in node and 'type' in node:
+            node_props = node['props']
+            if isinstance(node_props.get('id'), str):
+                for name, value in node_props.items():
+                    props[(node_props['id'], name)] = value
+            for value in node_props.values():
+                component_props(value, props)
+    return props
+
+
+class Callback:
+    def __init__(self, spec):
+        self.output = spec['output']
+        self.outputs = parse_outputs(spec['output'])
+        self.inputs = [(item['id'], item['property']) for item in spec['inputs']]
+        self.state = [(item['id'], item['property']) for item in spec['state']]
+        self.prevent_initial_call = spec.get('prevent_initial_call', False)
+        self.label = '.'.join(self.outputs[0])
+
+    def body(self, props, changed):
+        def values(items):
+            return [{'id': id_, 'property': prop, 'value': props.get((id_, prop))} for id_, prop in items]
+        outputs = [{'id': id_, 'property': prop} for id_, prop in self.outputs]
+        return {'output': self.output, 'outputs': outputs if len(outputs) > 1 else outputs[0],
+                'inputs': values(self.inputs), 'state': values(self.state),
+                'changedPropIds': [f'{id_}.{prop}' for id_, prop in self.inputs if (id_, prop) in changed]}
+
+
+class Recorder:
+    """ Latencies and error counts per label, from all sessions. """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.recording = False
+        self._lock = threading.Lock()
+
+    def add(self, label, seconds, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+class Session:
+    """ One simulated browser tab on its own keep-alive connection. """
+
+    def __init__(self, url, recorder, rng, think):
+        parts = urlsplit(url)
+        self.host, self.port, self.prefix = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+        self.recorder, self.rng, self.think = recorder, rng, think
+        self.connection = None
+
+    def request(self, method, path, label, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            start = time.perf_counter()
+            try:
+                self.connection.request(method, self.prefix + path, body=data, headers=HEADERS)
+                response = self.connection.getresponse()
+                payload = response.read()
+            except (OSError, http.client.HTTPException):
+                # The server closed an idle keep-alive connection: reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    self.recorder.add(label, time.perf_counter() - start, False)
+                    return None
+                continue
+            self.recorder.add(label, time.perf_counter() - start, response.status in (200, 204))
+            if response.status != 200:
+                return None
+            return gzip.decompress(payload) if response.getheader('Content-Encoding') == 'gzip' else payload
+        return None
+
+    def load_page(self):
+        self.request('GET', '/', 'page')
+        layout = self.request('GET', '/_dash-layout', 'layout')
+        dependencies = self.request('GET', '/_dash-dependencies', 'dependencies')
+        if layout is None or dependencies is None:
+            raise RuntimeError("could not load the dashboard's layout and callbacks")
+        self.props = component_props(json.loads(layout), {})
+        self.callbacks = [Callback(spec) for spec in json.loads(dependencies) if not spec.get('clientside_function')]
+        self.fire(None)
+
+    def fire(self, changed):
+        """ Fire the server callbacks triggered by `changed` (None: the initial callbacks), as Dash would. """
+        if changed is None:
+            pending = [cb for cb in self.callbacks if not cb.prevent_initial_call]
+            changed = set()
+        else:
+            pending = [cb for cb in self.callbacks if changed & set(cb.inputs)]
+        done = set()
+        while pending:
+            # A callback waits for other pending callbacks that write one of its inputs
+            ready = [cb for cb in pending
+                     if not any(other is not cb and set(other.outputs) & set(cb.inputs) for other in pending)]
+            ready = ready or pending[:1]
+            for cb in ready:
+                done.add(cb.output)
+                payload = self.request('POST', '/_dash-update-component', cb.label, cb.body(self.props, changed))
+                if payload is None:
+                    continue
+                written = set()
+                for id_, values in json.loads(payload).get('response', {}).items():
+                    for prop, value in values.items():
+                        self.props[(id_, prop)] = value
+                        written.add((id_, prop))
+                changed = changed | written
+                pending += [other for other in self.callbacks
+                            if other.output not in done and other not in pending and written & set(other.inputs)
+                            and other is not cb]
+            pending = [cb for cb in pending if cb.output not in done]
+
+    ### User actions
+    def set_prop(self, id_, prop, value):
+        self.props[(id_, prop)] = value
+        self.fire({(id_, prop)})
+
+    def move_nspec(self):
+        self.set_prop('nspec-slider', 'value', round(self.rng.uniform(3, 7), 1))
+
+    def move_resolution(self):
+        lo = self.rng.randrange(0, 6000, 100)
+        self.set_prop('resolution', 'value', [lo, self.rng.randrange(lo + 100, 7001, 100)])
+
+    def toggle_status(self):
+        status = self.rng.sample(STATUSES, self.rng.randint(1, len(STATUSES)))
+        self.set_prop('status', 'value', status)
+
+    def pick_facilities(self):
+        facilities = self.facilities()
+        count = self.rng.choice([0, 0, 1, 2, 3])
+        self.set_prop('facility', 'value', self.rng.sample(facilities, min(count, len(facilities))))
+
+    def facilities(self):
+        data = self.props.get(('facility', 'data')) or []
+        return [item['value'] if isinstance(item, dict) else item for item in data]
+
+    def type_search(self):
+        word = self.rng.choice(SEARCH_WORDS)
+        for i in range(1, len(word) + 1):
+            self.set_prop('search', 'value', word[:i])
+            time.sleep(self.rng.uniform(0.15, 0.3))  # typing faster than this is debounced away
+        if self.rng.random() < 0.5:
+            self.set_prop('search', 'value', '')
+
+    def zoom(self):
+        if self.rng.random() < 0.3:
+            relayout = {'xaxis.autorange': True, 'yaxis.autorange': True}
+        else:
+            # plotly reports ranges of log axes in log10 units, as figures.merge_viewport expects
+            x, y = self.rng.uniform(-1, 3.5), self.rng.uniform(-1, 4)
+            span = self.rng.uniform(0.3, 2)
+            relayout = {'xaxis.range[0]': x, 'xaxis.range[1]': x + span,
+                        'yaxis.range[0]': y, 'yaxis.range[1]': y + span}
+        self.set_prop('scatter-plot', 'relayoutData', relayout)
+
+    def change_summary(self):
+        if self.rng.random() < 0.5:
+            self.set_prop('summary-by', 'value', self.rng.choice(SUMMARY_BY))
+        else:
+            self.set_prop('summary-measure', 'value', self.rng.choice(SUMMARY_MEASURES))
+
+    # (action, relative frequency): mostly slider drags, as the dashboard is used
+    ACTIONS = [(move_nspec, 4), (move_resolution, 3), (toggle_status, 1), (pick_facilities, 1),
+               (type_search, 1), (zoom, 1), (change_summary, 1)]
+
+    def run(self, stop):
+        actions, weights = zip(*self.ACTIONS)
+        try:
+            self.load_page()
+        except Exception as e:
+            print(f"Session failed to start: {e}", file=sys.stderr)
+            return
+        try:
+            while not stop.is_set():
+                stop.wait(self.rng.expovariate(1 / self.think) if self.think > 0 else 0)
+                if not stop.is_set():
+                    self.rng.choices(actions, weights)[0](self)
+        finally:
+            if self.connection is not None:
+                self.connection.close()
+
+
+### Load runs
+def percentile(values, q):
+    """ Nearest-rank percentile of a sorted list. """
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)] if values else float('nan')
+
+
+def summarise(latencies, errors, seconds):
+    """ {label: requests, throughput, p50/p95/p99 (ms) and errors}, plus 'total' over every request. """
+    results = {}
+    every = sorted(t for times in latencies.values() for t in times)
+    for label, times in sorted(latencies.items()) + [('total', every)]:
+        times = sorted(times)
+        results[label] = {'requests': len(times), 'rps': len(times) / seconds,
+                          'p50_ms': percentile(times, 50) * 1000, 'p95_ms': percentile(times, 95) * 1000,
+                          'p99_ms': percentile(times, 99) * 1000,
+                          'errors': sum(errors.values()) if label == 'total' else errors.get(label, 0)}
+    return results
+
+
+def run_load(url, sessions, duration, warmup, think, seed=0):
+    """ Drive `sessions` concurrent sessions against url; statistics of the requests after the warm-up. """
+    recorder, stop = Recorder(), threading.Event()
+    threads = [threading.Thread(target=Session(url, recorder, random.Random(seed + i), think).run, args=(stop,),
+                                daemon=True) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+    recorder.recording = True
+    start = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    seconds = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=60)
+    return summarise(recorder.latencies, recorder.errors, seconds)
+
+
+### gunicorn
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=START_TIMEOUT):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"gunicorn did not answer within {timeout}s")
+
+
+def start_gunicorn(workers, threads, log, wsgi_app=None):
+    """ gunicorn with 'gunicorn.conf.py' on a free local port; returns (process, url). """
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads)]
+    if wsgi_app:
+        command.append(wsgi_app)
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(url, process)
+    except RuntimeError:
+        stop_gunicorn(process)
+        raise
+    return process, url
+
+
+def stop_gunicorn(process):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def synthetic_app(n, data_dir):
+    """ gunicorn app spec serving a synthetic catalogue of n surveys, compiled to a snapshot. """
+    from benchmarks.synthetic import write_catalogue
+    from catalogue import compile_snapshot
+    survey_dir = write_catalogue(n, os.path.join(data_dir, f'surveys-{n}'), force=True)
+    snapshot = os.path.join(data_dir, f'catalogue-{n}.npz')
+    compile_snapshot(survey_dir, snapshot)
+    return f'benchmarks.loadtest:create_server({survey_dir!r}, {snapshot!r})'
+
+
+def sweep(workers_list, threads_list, sessions, duration, warmup, think, surveys=None):
+    """ run_load against gunicorn for every workers x threads combination: {'<w>x<t>': results}. """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        wsgi_app = synthetic_app(surveys, tmp) if surveys else None
+        for workers in workers_list:
+            for threads in threads_list:
+                name = f'{workers}x{threads}'
+                print(f"gunicorn with {workers} worker(s) x {threads} thread(s), {sessions} sessions...",
+                      file=sys.stderr)
+                log_path = os.path.join(tmp, f'gunicorn-{name}.log')
+                with open(log_path, 'w') as log:
+                    try:
+                        process, url = start_gunicorn(workers, threads, log, wsgi_app)
+                    except RuntimeError as e:
+                        with open(log_path) as f:
+                            print(f"{e}; gunicorn log:\n{f.read()[-3000:]}", file=sys.stderr)
+                        raise
+                    try:
+                        results[name] = run_load(url, sessions, duration, warmup, think)
+                    finally:
+                        stop_gunicorn(process)
+                print_results({name: results[name]})
+    return results
+
+
+def print_results(results):
+    for name, labels in results.items():
+        print(f"\n{name}{'':<30}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for label, stats in labels.items():
+            print(f"  {label:<32}{stats['requests']:>9}{stats['rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+                  f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['errors']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the dashboard with concurrent simulated sessions.")
+    parser.add_argument('--workers', type=int, nargs='+', default=DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS)
+    parser.add_argument('--sessions', type=int, default=20, help="concurrent simulated browser sessions")
+    parser.add_argument('--duration', type=float, default=20, help="seconds measured per configuration")
+    parser.add_argument('--warmup', type=float, default=5, help="seconds run before measuring")
+    parser.add_argument('--think', type=float, default=1.0, help="mean pause between a session's actions (s)")
+    parser.add_argument('--surveys', type=int, help="serve a synthetic catalogue of this many surveys")
+    parser.add_argument('--url', help="load test this running server instead of sweeping gunicorn settings")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/loadtest-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    meta = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'sessions': args.sessions, 'duration': args.duration, 'warmup': args.warmup, 'think': args.think,
+            'surveys': args.surveys, 'url': args.url}
+    if args.url:
+        results = {args.url: run_load(args.url, args.sessions, args.duration, args.warmup, args.think)}
+        print_results(results)
+    else:
+        results = sweep(args.workers, args.threads, args.sessions, args.duration, args.warmup, args.think,
+                        args.surveys)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{meta['timestamp'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    print(f"Saved results to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,250 @@
+""" Benchmarks for catalogue loading, filtering, figure callbacks and exports.
+
+    python -m benchmarks.run                          # 66, 1k, 10k and 100k surveys
+    python -m benchmarks.run --sizes 66 1000 --repeat 10
+    python -m benchmarks.run --compare old.json new.json
+
+For each catalogue size a synthetic 'surveys/' directory is generated
+(benchmarks.synthetic) and the following are timed:
+
+    ingest_json / ingest_snapshot  startup ingestion through catalogue.py
+    ingest_legacy                  the original glob + pd.read_json + concat/transpose
+    filter / filter_legacy         FilterIndex.query vs. the original pandas masks
+    search / search_scan           SearchIndex matches + top results per keystroke vs. str.contains scans
+    summary / summary_groupby      summary tables from the aggregate cube vs. pandas groupby + quantile
+    figure_callback                uncached update_bar_chart work (filter, traces, Patch, JSON)
+    figure_callback_compact        the same in the compact encoding (SPECSURVEYS_COMPACT_FIGURES)
+    figure_legacy                  the original mask + px.scatter figure, serialised
+    download / download_legacy     /export CSV stream vs. the original dcc.send_data_frame
+    payload_*                      serialised callback response sizes in bytes (and gzipped)
+
+Timings are in seconds over a fixed set of filter states. Results are written as
+JSON to benchmarks/results/ so runs can be compared with --compare.
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import dash
+import pandas as pd
+import plotly
+from plotly.io.json import to_json_plotly
+
+from benchmarks import legacy
+from benchmarks.synthetic import write_catalogue
+from catalogue import compile_snapshot, load_catalogue
+from export import csv_chunks
+from filters import nspec_threshold
+from compression import GZIP_LEVEL
+from figures import (build_base_figure, compact_patch, compact_update, figure_patch, figure_update,
+                     full_compact_figure, full_figure)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = [66, 1000, 10000, 100000]
+
+ALL_STATUS = ['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished']
+
+# (status, facilities, log10 min Nspec, resolution range), the default view first
+FILTER_STATES = [
+    (ALL_STATUS, [], 4.699, [0, 7000]),
+    (ALL_STATUS, [], 3.0, [0, 7000]),
+    (['Complete'], [], 5.0, [0, 7000]),
+    (['Ongoing', 'Proposed / Planned'], ['DESI', '4MOST'], 4.0, [0, 7000]),
+    (ALL_STATUS, ['AAT'], 3.5, [1000, 3000]),
+    (ALL_STATUS, [], 6.5, [0, 7000]),
+]
+
+# Every keystroke of a few searches typed into the search box
+SEARCH_QUERIES = [text[:i] for text in ('galaxy redshift', 'sdss', 'desi bright', 'lyman') for i in range(1, len(text) + 1)
+                  if text[i - 1] != ' ']
+SEARCH_FIELDS = ['Survey', 'Full Name', 'Instrument', 'Facility', 'Notes']
+SUMMARY_DIMENSIONS = ['Facility', 'Selection Wavelength', 'Selection Type']
+
+
+def timed(fn, repeat):
+    """ Run fn `repeat` times; summary statistics of the wall time in seconds. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times),
+            'repeat': repeat}
+
+
+def over_states(fn):
+    return lambda: [fn(*state) for state in FILTER_STATES]
+
+
+def rows_for(cat, status, facilities, nspec_log, resolution):
+    return cat.index.query(status=status, facilities=facilities,
+                           min_nspec=nspec_threshold(nspec_log), resolution=resolution)
+
+
+def bench_size(n, data_dir, repeat, legacy_max):
+    survey_dir = write_catalogue(n, os.path.join(data_dir, f'surveys-{n}'), force=True)
+    snapshot = os.path.join(data_dir, f'catalogue-{n}.npz')
+    results = {}
+    ingest_repeat = repeat if n <= 10000 else 1
+
+    # Startup ingestion
+    results['ingest_json'] = timed(lambda: load_catalogue(survey_dir, snapshot), ingest_repeat)
+    results['snapshot_compile'] = timed(lambda: compile_snapshot(survey_dir, snapshot), 1)
+    results['ingest_snapshot'] = timed(lambda: load_catalogue(survey_dir, snapshot), ingest_repeat)
+    run_legacy = n <= legacy_max
+    if run_legacy:
+        results['ingest_legacy'] = timed(lambda: legacy.load_surveys(survey_dir), ingest_repeat)
+
+    cat = load_catalogue(survey_dir, snapshot)
+    base = build_base_figure()
+
+    # Filtering alone
+    results['filter'] = timed(over_states(lambda *s: rows_for(cat, *s)), repeat)
+    legacy_df = cat.frame.astype({col: object for col in ['Survey Status', 'Facility', 'Selection Wavelength']})
+    results['filter_legacy'] = timed(over_states(lambda *s: legacy.filter_mask(legacy_df, *s)), repeat)
+
+    # Search box: the matching rows and the best few, per keystroke
+    def search(query):
+        return cat.search.matches(query), cat.search.ranked(query, limit=5)
+
+    def search_scan(query):
+        mask = pd.Series(True, index=cat.frame.index)
+        for word in query.split():
+            mask &= pd.concat([cat.frame[field].astype(str).str.contains(word, case=False, regex=False)
+                               for field in SEARCH_FIELDS], axis=1).any(axis=1)
+        return mask
+    results['search'] = timed(lambda: [search(query) for query in SEARCH_QUERIES], repeat)
+    results['search_scan'] = timed(lambda: [search_scan(query) for query in SEARCH_QUERIES], max(1, repeat // 2))
+
+    # Summary tables: every grouping offered by the dashboard, split by survey status
+    def summary_groupby(by):
+        grouped = cat.frame.groupby([by, 'Survey Status'], observed=True)
+        return grouped['Nspec'].agg(['size', 'sum']), grouped[['Nspec', 'Area', 'Density']].quantile([0.1, 0.5, 0.9])
+    results['summary'] = timed(lambda: [cat.cube.rollup([by, 'Survey Status']) for by in SUMMARY_DIMENSIONS], repeat)
+    results['summary_groupby'] = timed(lambda: [summary_groupby(by) for by in SUMMARY_DIMENSIONS], repeat)
+
+    # update_bar_chart on a cache miss: filter, per-slot traces, Patch and its JSON encoding
+    def figure_callback(*state):
+        update = figure_update(cat.frame.iloc[rows_for(cat, *state)], cat.wavelengths)
+        return to_json_plotly(figure_patch(update))
+    results['figure_callback'] = timed(over_states(figure_callback), repeat)
+    results['figure_callback_compact'] = timed(
+        over_states(lambda *s: to_json_plotly(compact_patch(compact_update(cat, rows_for(cat, *s))))), repeat)
+    if run_legacy:
+        results['figure_legacy'] = timed(
+            over_states(lambda *s: to_json_plotly(legacy.update_bar_chart(legacy_df, *s))), max(1, repeat // 2))
+
+    # download_filtered_data end to end (default view)
+    state = FILTER_STATES[0]
+    results['download'] = timed(lambda: ''.join(csv_chunks(cat.frame, rows_for(cat, *state))), repeat)
+    if run_legacy:
+        results['download_legacy'] = timed(
+            lambda: json.dumps(legacy.download_filtered_data(legacy_df, *state)), repeat)
+
+    # Serialised response sizes: the first render in the default view, then a change to each other state
+    update = figure_update(cat.frame.iloc[rows_for(cat, *state)], cat.wavelengths)
+    payloads = {
+        'full_figure': full_figure(base, cat.wavelengths, update),
+        'patch': figure_patch(figure_update(cat.frame.iloc[rows_for(cat, *FILTER_STATES[1])], cat.wavelengths)),
+        'compact_full_figure': full_compact_figure(build_base_figure(compact=True), cat,
+                                                   compact_update(cat, rows_for(cat, *state))),
+        'compact_patch': compact_patch(compact_update(cat, rows_for(cat, *FILTER_STATES[1]))),
+    }
+    if run_legacy:
+        payloads['legacy_figure'] = legacy.update_bar_chart(legacy_df, *FILTER_STATES[1])
+    for name, payload in payloads.items():
+        encoded = to_json_plotly(payload).encode()
+        results[f'payload_{name}'] = len(encoded)
+        results[f'payload_{name}_gzip'] = len(gzip.compress(encoded, compresslevel=GZIP_LEVEL))
+    results['rows'] = len(cat.frame)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, repeat, legacy_max, data_dir=None, output=None):
+    meta = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'pandas': pd.__version__, 'plotly': plotly.__version__, 'dash': dash.__version__,
+            'repeat': repeat, 'filter_states': len(FILTER_STATES)}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            print(f"Benchmarking {n} surveys...", file=sys.stderr)
+            results[str(n)] = bench_size(n, data_dir or tmp, repeat, legacy_max)
+            print_results({str(n): results[str(n)]})
+
+    output = output or os.path.join(RESULTS_DIR, f"{meta['timestamp'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    print(f"Saved results to {output}", file=sys.stderr)
+    return output
+
+
+def metric_value(value):
+    return value['median'] if isinstance(value, dict) else value
+
+
+def print_results(results):
+    for n, metrics in results.items():
+        print(f"\n{n} surveys")
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                print(f"  {name:<34}{value['median'] * 1000:>12.3f} ms")
+            else:
+                print(f"  {name:<34}{value:>12}")
+
+
+def compare(old_path, new_path, threshold):
+    """ Print new/old ratios of every metric; returns the number of regressions beyond threshold. """
+    with open(old_path) as f:
+        old = json.load(f)['results']
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    regressions = 0
+    for n in [n for n in new if n in old]:
+        print(f"\n{n} surveys{'':<26}{'old':>12}{'new':>12}{'new/old':>10}")
+        for name in [name for name in new[n] if name in old[n] and name != 'rows']:
+            a, b = metric_value(old[n][name]), metric_value(new[n][name])
+            ratio = b / a if a else float('inf')
+            flag = '  REGRESSION' if ratio > threshold else ''
+            regressions += bool(flag)
+            print(f"  {name:<34}{a:>12.4g}{b:>12.4g}{ratio:>10.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the survey dashboard at synthetic catalogue sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help="skip the original (slow) code paths above this many surveys")
+    parser.add_argument('--data-dir', help="keep generated catalogues here instead of a temporary directory")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="new/old ratio counted as a regression by --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+    run(args.sizes, args.repeat, args.legacy_max, args.data_dir, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
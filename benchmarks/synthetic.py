@@ -0,0 +1,77 @@
+""" Synthetic survey catalogues shaped like the real 'surveys/' library.
+
+    python -m benchmarks.synthetic 10000 /tmp/surveys-10k
+    python -m benchmarks.synthetic 10000 /tmp/surveys-10k --force   # replace an earlier catalogue
+
+The real surveys are always included; extra surveys are drawn from them with
+Nspec and Area scattered in log space, and with new facilities appearing at a
+steady rate so the facility list grows with the catalogue.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+from catalogue import SURVEY_DIR, read_survey, survey_files
+from figures import max_area
+
+NEW_FACILITY_EVERY = 200
+
+
+def synthetic_surveys(n, seed=0, survey_dir=SURVEY_DIR):
+    """ n survey dicts: the real surveys first, then perturbed copies of them. """
+    rng = np.random.default_rng(seed)
+    real = [read_survey(path) for path in survey_files(survey_dir)]
+    surveys = real[:n]
+    for i in range(len(surveys), n):
+        survey = dict(real[rng.integers(len(real))])
+        survey['Survey'] = f"{survey['Survey']}-syn{i}"
+        survey['Full Name'] = f"{survey['Full Name']} (synthetic {i})"
+        survey['Nspec'] = int(max(100, round(survey['Nspec'] * 10 ** rng.normal(0, 0.5))))
+        survey['Area'] = float(min(max_area, max(0.01, survey['Area'] * 10 ** rng.normal(0, 0.5))))
+        survey['Status'] = int(rng.choice([0, 1, 2, 3], p=[0.55, 0.17, 0.27, 0.01]))
+        if rng.random() < 1 / NEW_FACILITY_EVERY:
+            survey['Facility'] = f"Facility-{i // NEW_FACILITY_EVERY}"
+        surveys.append(survey)
+    return surveys
+
+
+def write_catalogue(n, out_dir, seed=0, force=False):
+    """ Write n synthetic survey '.json' files into out_dir.
+
+    An existing non-empty out_dir is only replaced with force=True, and the real
+    'surveys/' directory never is. Raises ValueError otherwise.
+    """
+    if os.path.realpath(out_dir) == os.path.realpath(SURVEY_DIR):
+        raise ValueError(f"refusing to overwrite the real survey library in {out_dir}")
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        if not force:
+            raise ValueError(f"{out_dir} is not empty, pass force=True (--force) to replace its contents")
+        shutil.rmtree(out_dir)
+    elif os.path.exists(out_dir) and not os.path.isdir(out_dir):
+        raise ValueError(f"{out_dir} is not a directory")
+    os.makedirs(out_dir, exist_ok=True)
+    for i, survey in enumerate(synthetic_surveys(n, seed)):
+        with open(os.path.join(out_dir, f"{i:06d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(survey, f, indent=4)
+    return out_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic survey catalogue.")
+    parser.add_argument('n', type=int, help="number of surveys")
+    parser.add_argument('out_dir', help="directory to write the '.json' files to")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help="replace the contents of a non-empty out_dir")
+    args = parser.parse_args(argv)
+    try:
+        write_catalogue(args.n, args.out_dir, args.seed, force=args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {args.n} surveys to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+""" Survey catalogue ingestion and compiled snapshots.
+
+The survey library lives in one '.json' file per survey under 'surveys/'. Parsing
+every file at import is slow and yields an all-object DataFrame, so the directory
+can be compiled into a typed, columnar snapshot:
+
+    python catalogue.py            # compile surveys/ into catalogue.snapshot.npz
+
+The snapshot is an uncompressed '.npz' file holding one typed array per numeric
+column and, per string column, the UTF-8 text of all rows back to back with their
+offsets, so it loads without parsing and is not padded to the longest value. A
+JSON manifest records the content hash of every source file. The app uses the
+snapshot whenever it matches the 'surveys/' directory and falls back to the JSON
+files only when it is missing or stale.
+
+Either way the result is wrapped in an immutable Catalogue: typed, pre-sorted and
+indexed once, and never modified by request handlers, so it can be shared by any
+number of threads. A CatalogueStore holds the current Catalogue and, on reload(),
+re-reads only the survey files that changed and swaps in a new Catalogue in one
+assignment; requests already holding the old one are unaffected. Every process
+serving the same survey directory (e.g. each gunicorn worker) has its own store;
+request_reload() tells all of their watchers to reload through a shared trigger file.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AggregateCube
+from filters import FilterIndex
+from search import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SURVEY_DIR = os.path.join(BASE_DIR, 'surveys')
+SNAPSHOT_PATH = os.path.join(BASE_DIR, 'catalogue.snapshot.npz')
+SNAPSHOT_FORMAT = 2
+# Seconds between checks of the reload trigger file by CatalogueStore.watch()
+TRIGGER_POLL = 1.0
+
+status_types = ['Complete', 'Ongoing', 'Proposed / Planned', 'Special / Unfinished']
+
+wlcolm_new = {'X-ray': 0, 'UV': 1, # X-ray-UV
+              '300-500nm': 2, '500-950nm': 3, # Optical Range
+              '0.95-2.5µm': 4, '2.5-5µm': 5, '5-1000µm': 6, # IR Ranges
+              'Radio': 7, # mm-Radio
+              }
+
+
+def manifest_path(snapshot_path):
+    return os.path.splitext(snapshot_path)[0] + '.json'
+
+
+def survey_files(survey_dir=SURVEY_DIR):
+    surveys_jsons = glob.glob(os.path.join(survey_dir, '*.json'))
+    surveys_jsons.sort()
+    return surveys_jsons
+
+
+def trigger_path(survey_dir):
+    """ Reload trigger file shared by every process serving survey_dir. """
+    digest = hashlib.sha256(os.path.abspath(survey_dir).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'specsurveys-reload-{digest}')
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def file_record(path, digest=None):
+    stat = os.stat(path)
+    return {'sha256': digest or file_digest(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def catalogue_version(files):
+    """ Short content hash identifying a set of source files ({name: record}). """
+    h = hashlib.sha256()
+    for name in sorted(files):
+        h.update(f"{name}:{files[name]['sha256']}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def read_survey(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+### Column typing
+def column_kind(values):
+    """ 'int', 'float' or 'str' for the (non-missing) values of one survey property. """
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return 'int' if len(present) == len(values) else 'float'
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return 'float'
+    return 'str'
+
+
+def infer_columns(records):
+    """ Ordered {column: kind} over all records, in order of first appearance. """
+    columns = {}
+    for record in records:
+        for key in record:
+            columns.setdefault(key, None)
+    return {key: column_kind([record.get(key) for record in records]) for key in columns}
+
+
+def typed_column(values, kind):
+    if kind == 'int':
+        return np.array(values, dtype=np.int64)
+    if kind == 'float':
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(['' if v is None else str(v) for v in values], dtype=object)
+
+
+def frame_from_records(records, columns=None):
+    """ Typed DataFrame from a list of survey dicts (one row per survey). """
+    columns = columns or infer_columns(records)
+    data = {}
+    for key, kind in columns.items():
+        data[key] = typed_column([record.get(key) for record in records], kind)
+    return pd.DataFrame(data)
+
+
+### Snapshots
+def compile_snapshot(survey_dir=SURVEY_DIR, snapshot_path=SNAPSHOT_PATH):
+    """ Compile every survey '.json' file into a snapshot and its manifest. Returns the manifest. """
+    paths = survey_files(survey_dir)
+    records = [read_survey(path) for path in paths]
+    columns = infer_columns(records)
+    arrays = {}
+    for i, (key, kind) in enumerate(columns.items()):
+        values = [record.get(key) for record in records]
+        if kind == 'str':
+            encoded = [b'' if v is None else str(v).encode('utf-8') for v in values]
+            arrays[f'text{i}'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            arrays[f'offsets{i}'] = np.cumsum([0] + [len(text) for text in encoded], dtype=np.int64)
+        else:
+            arrays[f'column{i}'] = typed_column(values, kind)
+
+    files = {os.path.basename(path): file_record(path) for path in paths}
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': catalogue_version(files),
+        'rows': len(records),
+        'columns': columns,
+        'sources': [os.path.basename(path) for path in paths],
+        'files': files,
+    }
+
+    # Write to temporary names first so a running app never sees half a snapshot
+    tmp_snapshot = snapshot_path + '.tmp'
+    tmp_manifest = manifest_path(snapshot_path) + '.tmp'
+    with open(tmp_snapshot, 'wb') as f:
+        np.savez(f, **arrays)
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_snapshot, snapshot_path)
+    os.replace(tmp_manifest, manifest_path(snapshot_path))
+    return manifest
+
+
+def read_manifest(snapshot_path=SNAPSHOT_PATH):
+    try:
+        with open(manifest_path(snapshot_path), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT or not os.path.exists(snapshot_path):
+        return None
+    return manifest
+
+
+def snapshot_is_fresh(manifest, survey_dir=SURVEY_DIR):
+    """ True if the manifest describes exactly the current contents of survey_dir.
+
+    Files are compared on size and mtime first and only re-hashed when those differ,
+    so the common case costs one stat() per survey.
+    """
+    if manifest is None:
+        return False
+    paths = survey_files(survey_dir)
+    files = manifest['files']
+    if sorted(files) != [os.path.basename(path) for path in paths]:
+        return False
+    for path in paths:
+        recorded = files[os.path.basename(path)]
+        stat = os.stat(path)
+        if stat.st_size == recorded['size'] and stat.st_mtime_ns == recorded['mtime_ns']:
+            continue
+        if stat.st_size != recorded['size'] or file_digest(path) != recorded['sha256']:
+            return False
+    return True
+
+
+def load_snapshot(snapshot_path, columns):
+    """ Raw survey frame from a snapshot, given the manifest's {column: kind}. """
+    data = {}
+    with np.load(snapshot_path) as arrays:
+        for i, (key, kind) in enumerate(columns.items()):
+            if kind != 'str':
+                data[key] = arrays[f'column{i}']
+                continue
+            text, offsets = arrays[f'text{i}'].tobytes(), arrays[f'offsets{i}'].tolist()
+            values = [text[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1], offsets[1:])]
+            data[key] = np.array(values, dtype=object)
+    return pd.DataFrame(data, copy=False)
+
+
+### The catalogue used by the app
+@dataclass(frozen=True)
+class Catalogue:
+    """ One immutable version of the survey catalogue.
+
+    frame is sorted by selection wavelength and must be treated as read-only: every
+    derived structure (index, search, wavelengths, facilities) refers to its row positions.
+    """
+    frame: pd.DataFrame
+    version: str
+    sources: tuple  # source file name of each row
+    index: FilterIndex
+    search: SearchIndex
+    cube: AggregateCube  # totals and quantiles by facility, wavelength, status and selection type
+    wavelengths: tuple  # selection wavelengths present, in legend order
+    facilities: tuple
+    modified: float  # latest mtime of the source files (epoch seconds)
+
+    def query(self, search=None, **filters):
+        """ FilterIndex.query() positions, narrowed to the surveys matching a free-text search. """
+        rows = self.index.query(**filters)
+        if search:
+            rows = np.intersect1d(rows, self.search.matches(search), assume_unique=True)
+        return rows
+
+
+def prepare_frame(df):
+    """ Add the derived columns, set the column types and sort by selection wavelength. """
+    df = df.copy(deep=False)  # columns are only ever replaced below, never written to
+    for column in ['Nspec', 'Area', 'Resolution']:
+        df[column] = pd.to_numeric(df[column])
+    df['Density'] = df['Nspec'] / df['Area']
+    df['Survey Status'] = pd.Categorical.from_codes(np.asarray(df['Status'], dtype=np.int64), status_types)
+    wavelengths = sorted(set(df['Selection Wavelength']), key=lambda wl: (wl not in wlcolm_new, wlcolm_new.get(wl), wl))
+    df['Selection Wavelength'] = pd.Categorical(df['Selection Wavelength'], categories=wavelengths, ordered=True)
+    df['Facility'] = pd.Categorical(df['Facility'], categories=sorted(set(df['Facility'])))
+
+    order = np.argsort(df['Selection Wavelength'].cat.codes.to_numpy(), kind='stable')
+    return df.iloc[order], order
+
+
+def build_catalogue(df, sources, files, cube=None):
+    """ Catalogue from raw survey rows, their source file names and {name: file record}.
+
+    cube, if given, must already aggregate exactly these rows (see CatalogueStore.reload).
+    """
+    frame, order = prepare_frame(df)
+    version = catalogue_version(files)
+    modified = max((record['mtime_ns'] for record in files.values()), default=0) / 1e9
+    return Catalogue(frame=frame, version=version, modified=modified,
+                     sources=tuple(np.asarray(sources, dtype=object)[order]),
+                     index=FilterIndex(frame, version),
+                     search=SearchIndex(frame),
+                     cube=cube if cube is not None else AggregateCube.from_frame(frame),
+                     wavelengths=tuple(frame['Selection Wavelength'].cat.categories),
+                     facilities=tuple(frame['Facility'].cat.categories))
+
+
+def read_sources(survey_dir=SURVEY_DIR, snapshot_path=SNAPSHOT_PATH):
+    """ Raw survey frame, preferring a fresh compiled snapshot. Returns (df, sources, files). """
+    start = time.perf_counter()
+    manifest = read_manifest(snapshot_path)
+    if snapshot_is_fresh(manifest, survey_dir):
+        df, sources, files = load_snapshot(snapshot_path, manifest['columns']), manifest['sources'], manifest['files']
+        origin = 'snapshot'
+    else:
+        if manifest is not None:
+            logger.warning("Catalogue snapshot %s is stale, reading %s instead", snapshot_path, survey_dir)
+        paths = survey_files(survey_dir)
+        df = frame_from_records([read_survey(path) for path in paths])
+        sources = [os.path.basename(path) for path in paths]
+        files = {os.path.basename(path): file_record(path) for path in paths}
+        origin = 'json'
+    logger.info("Read %d surveys from %s in %.3fs", len(df), origin, time.perf_counter() - start)
+    return df, sources, files
+
+
+def load_catalogue(survey_dir=SURVEY_DIR, snapshot_path=SNAPSHOT_PATH):
+    """ Load the survey Catalogue, preferring a fresh compiled snapshot. """
+    df, sources, files = read_sources(survey_dir, snapshot_path)
+    return build_catalogue(df, sources, files)
+
+
+class CatalogueStore:
+    """ The current Catalogue, replaced atomically when the survey files change.
+
+    Readers take `store.current` once per request and use that object throughout.
+    reload() re-reads only files whose size/mtime and content hash changed, builds a
+    new Catalogue alongside the old one and then swaps the reference, after which
+    every subscribed listener is called with the new Catalogue (to drop caches etc.).
+
+    Stores in other processes only see the change once they reload too: request_reload()
+    touches a trigger file that the watch() thread of every store on survey_dir polls.
+    """
+
+    def __init__(self, survey_dir=SURVEY_DIR, snapshot_path=SNAPSHOT_PATH):
+        self.survey_dir = survey_dir
+        self.trigger_path = trigger_path(survey_dir)
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        start = time.perf_counter()
+        df, sources, self._files = read_sources(survey_dir, snapshot_path)
+        # Raw (unprepared) rows by source file, so a reload only parses changed files
+        self._raw = df.set_axis(pd.Index(sources, name='source'))
+        self.current = build_catalogue(df, sources, self._files)
+        # Seconds taken to build the current catalogue (the initial load or the last reload)
+        self.load_seconds = time.perf_counter() - start
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def scan(self):
+        """ Compare survey_dir with the loaded files. Returns (files, changed paths, removed names). """
+        files, changed = {}, []
+        for path in survey_files(self.survey_dir):
+            name = os.path.basename(path)
+            recorded = self._files.get(name)
+            stat = os.stat(path)
+            if recorded and stat.st_size == recorded['size'] and stat.st_mtime_ns == recorded['mtime_ns']:
+                files[name] = recorded
+                continue
+            files[name] = file_record(path)
+            if not recorded or files[name]['sha256'] != recorded['sha256']:
+                changed.append(path)
+        removed = sorted(set(self._files) - set(files))
+        return files, changed, removed
+
+    def reload(self):
+        """ Re-ingest changed survey files. Returns the new Catalogue, or None if nothing changed. """
+        with self._reload_lock:
+            start = time.perf_counter()
+            files, changed, removed = self.scan()
+            if not changed and not removed:
+                # Content unchanged, but remember new mtimes so the files are not hashed again
+                self._files = files
+                return None
+
+            names = [os.path.basename(path) for path in changed]
+            replaced = self._raw.index.isin(names + removed)
+            # Files that were only removed leave nothing to add (and no columns to prepare)
+            new_rows = None
+            if changed:
+                new_rows = frame_from_records([read_survey(path) for path in changed])
+                new_rows = new_rows.set_axis(pd.Index(names, name='source'))
+            raw = pd.concat([self._raw[~replaced]] + ([new_rows] if new_rows is not None else [])).sort_index()
+
+            # Only the replaced and new rows go through the aggregate cube
+            cube = self.current.cube.updated(
+                removed=prepare_frame(self._raw[replaced])[0] if replaced.any() else None,
+                added=prepare_frame(new_rows)[0] if new_rows is not None else None)
+            catalogue = build_catalogue(raw.reset_index(drop=True), list(raw.index), files, cube)
+            self._raw, self._files = raw, files
+            self.current = catalogue
+            self.load_seconds = time.perf_counter() - start
+            logger.info("Reloaded catalogue in %.3fs: %d changed, %d removed (version %s)",
+                        self.load_seconds, len(changed), len(removed), catalogue.version)
+
+        for listener in self._listeners:
+            listener(catalogue)
+        return catalogue
+
+    def trigger_mtime(self):
+        try:
+            return os.stat(self.trigger_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def request_reload(self):
+        """ Make every store watching survey_dir, in any process, reload within TRIGGER_POLL seconds. """
+        with open(self.trigger_path, 'a'):
+            pass
+        os.utime(self.trigger_path)
+
+    def watch(self, interval=0):
+        """ Reload in a daemon thread whenever the trigger file is touched (request_reload) and,
+        if interval > 0, also poll survey_dir for changes every `interval` seconds.
+
+        The first reload happens straight away, so a process started from an older catalogue
+        (e.g. a gunicorn worker forked from the preloaded master) catches up with the files.
+        """
+        def reload():
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Catalogue reload failed, keeping version %s", self.current.version)
+
+        def poll():
+            seen = self.trigger_mtime()
+            reload()
+            last_scan = time.monotonic()
+            while True:
+                time.sleep(min(interval, TRIGGER_POLL) if interval > 0 else TRIGGER_POLL)
+                triggered = self.trigger_mtime()
+                if triggered != seen or (interval > 0 and time.monotonic() - last_scan >= interval):
+                    # Remember the trigger before reloading, so a touch during the reload is not missed
+                    seen, last_scan = triggered, time.monotonic()
+                    reload()
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=poll, name='catalogue-watcher', daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the survey '.json' files into a catalogue snapshot.")
+    parser.add_argument('--surveys', default=SURVEY_DIR, help="directory of survey '.json' files")
+    parser.add_argument('--output', default=SNAPSHOT_PATH, help="snapshot path (manifest is written alongside)")
+    parser.add_argument('--check', action='store_true',
+                        help="only check whether the existing snapshot is up to date (exit status 1 if stale)")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        fresh = snapshot_is_fresh(read_manifest(args.output), args.surveys)
+        print(f"{args.output}: {'up to date' if fresh else 'stale'}")
+        return 0 if fresh else 1
+
+    manifest = compile_snapshot(args.surveys, args.output)
+    print(f"Wrote {manifest['rows']} surveys to {args.output} (version {manifest['version']})")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
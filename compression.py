@@ -0,0 +1,81 @@
+""" gzip/brotli compression of server responses.
+
+Text responses (callback JSON, the layout, the Dash JavaScript bundles, API results) are
+compressed with brotli when the 'brotli' package is installed and the client accepts it,
+otherwise with gzip. Responses that browsers may cache for good (the fingerprinted Dash
+bundles) are compressed once and kept. Streamed responses such as /export are sent as is.
+"""
+import gzip
+import importlib.util
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+MIN_SIZE = 500
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+CACHE_ENTRIES = 64
+
+COMPRESSIBLE = ('text/', 'application/json', 'application/javascript', 'application/x-ndjson',
+                'application/xml', 'application/x-votable+xml', 'image/svg+xml')
+
+
+def brotli_available():
+    return importlib.util.find_spec('brotli') is not None
+
+
+def encodings():
+    return ['br', 'gzip'] if brotli_available() else ['gzip']
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compressible(response):
+    return (response.status_code == 200 and not response.is_streamed and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and not response.cache_control.no_transform
+            and (response.mimetype or '').startswith(COMPRESSIBLE)
+            and (response.calculate_content_length() or 0) >= MIN_SIZE)
+
+
+def register_compression(server):
+    """ Compress the responses of the Flask server according to the request's Accept-Encoding. """
+    offered = encodings()
+    # (path with query string, encoding) -> compressed body, for responses cacheable for a long time
+    cache = OrderedDict()
+    lock = threading.Lock()
+
+    @server.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not compressible(response):
+            return response
+        encoding = request.accept_encodings.best_match(offered)
+        if encoding is None:
+            return response
+
+        cacheable = (response.cache_control.max_age or 0) >= 86400
+        key = (request.full_path, encoding)
+        with lock:
+            body = cache.get(key) if cacheable else None
+        if body is None:
+            body = compress(response.get_data(), encoding)
+            if cacheable:
+                with lock:
+                    cache[key] = body
+                    while len(cache) > CACHE_ENTRIES:
+                        cache.popitem(last=False)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation of the same resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
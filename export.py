@@ -0,0 +1,173 @@
+""" Streaming export of the (filtered) survey catalogue.
+
+GET /export/<format>?status=...&facility=...&nspec=...&resolution=min,max
+
+takes the same filters as the dashboard (see filters.parse_filter_args) and streams
+the matching surveys in chunks as CSV, JSON Lines, Parquet or VOTable. The writers get
+the catalogue frame and the positions of the matching rows and copy one chunk of
+CHUNK_ROWS rows at a time, so memory use does not grow with the size of the export.
+Responses carry an ETag and Last-Modified derived from the catalogue version, and repeat
+downloads get 304 Not Modified.
+"""
+import hashlib
+import importlib.util
+import itertools
+import json
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+from flask import Response, request, stream_with_context
+from werkzeug.http import http_date, is_resource_modified
+
+from filters import parse_filter_args
+
+CHUNK_ROWS = 1000
+
+
+def chunks(frame, rows, chunk_rows=CHUNK_ROWS):
+    """ The rows of frame at positions `rows`, CHUNK_ROWS at a time. """
+    for start in range(0, len(rows), chunk_rows):
+        yield frame.iloc[rows[start:start + chunk_rows]]
+
+
+def csv_chunks(frame, rows):
+    # Same layout as the old dcc.send_data_frame(df.to_csv) download, index included
+    yield frame.iloc[:0].to_csv()
+    for chunk in chunks(frame, rows):
+        yield chunk.to_csv(header=False)
+
+
+def jsonl_chunks(frame, rows):
+    for chunk in chunks(frame, rows):
+        text = chunk.to_json(orient='records', lines=True, force_ascii=False)
+        yield text if text.endswith('\n') else text + '\n'
+
+
+### Parquet (requires pyarrow)
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+class ChunkSink:
+    """ Minimal writable file object that hands over whatever has been written so far. """
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self.buffer = b''.join(self.buffer), []
+        return data
+
+
+def parquet_chunks(frame, rows):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Plain strings rather than dictionaries, so every row group shares one schema
+    categorical = {col: object for col in frame.columns if isinstance(frame[col].dtype, pd.CategoricalDtype)}
+    tables = (chunk.astype(categorical) for chunk in chunks(frame, rows))
+    first = next(tables, frame.iloc[:0].astype(categorical))
+    schema = pa.Schema.from_pandas(first, preserve_index=False)
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in itertools.chain([first], tables):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()
+
+
+### VOTable (TABLEDATA serialisation)
+def votable_field(name, dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        datatype = 'datatype="boolean"'
+    elif pd.api.types.is_integer_dtype(dtype):
+        datatype = 'datatype="long"'
+    elif pd.api.types.is_float_dtype(dtype):
+        datatype = 'datatype="double"'
+    else:
+        datatype = 'datatype="unicodeChar" arraysize="*"'
+    return f'<FIELD name={quoteattr(str(name))} {datatype}/>'
+
+
+def votable_cell(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return '<TD/>'
+    return f'<TD>{escape(str(value))}</TD>'
+
+
+def votable_chunks(frame, rows):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<VOTABLE version="1.4" xmlns="http://www.ivoa.net/xml/VOTable/v1.3">\n'
+           '<RESOURCE>\n<TABLE name="surveys">\n' +
+           ''.join(votable_field(col, frame[col].dtype) + '\n' for col in frame.columns) +
+           '<DATA>\n<TABLEDATA>\n')
+    for chunk in chunks(frame, rows):
+        yield ''.join('<TR>' + ''.join(votable_cell(value) for value in row) + '</TR>\n'
+                      for row in chunk.itertuples(index=False, name=None))
+    yield '</TABLEDATA>\n</DATA>\n</TABLE>\n</RESOURCE>\n</VOTABLE>\n'
+
+
+# format: (mimetype, file extension, chunk generator)
+FORMATS = {
+    'csv': ('text/csv', 'csv', csv_chunks),
+    'jsonl': ('application/x-ndjson', 'jsonl', jsonl_chunks),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', parquet_chunks),
+    'votable': ('application/x-votable+xml', 'vot', votable_chunks),
+}
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or parquet_available()]
+
+
+def export_etag(version, fmt, query):
+    """ Strong ETag for one export: catalogue version plus the normalised filters. """
+    normalised = {key: sorted(value) if isinstance(value, list) and key != 'resolution' else value
+                  for key, value in query.items() if value is not None}
+    digest = hashlib.sha1(json.dumps([fmt, normalised], sort_keys=True).encode()).hexdigest()[:12]
+    return f'{version}-{digest}'
+
+
+def register_export(server, catalogue_store):
+    """ Add the /export/<format> route to the Flask server. """
+
+    def download_filtered_data(fmt):
+        if fmt not in available_formats():
+            return {'error': f"unknown format '{fmt}', expected one of {available_formats()}"}, 404
+        try:
+            query = parse_filter_args(request.args)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        # One catalogue for the whole response, even if a reload swaps it mid-stream
+        cat = catalogue_store.current
+        etag = export_etag(cat.version, fmt, query)
+        modified = datetime.fromtimestamp(int(cat.modified), timezone.utc)
+        headers = {'ETag': f'"{etag}"', 'Last-Modified': http_date(modified), 'Cache-Control': 'no-cache'}
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+            return Response(status=304, headers=headers)
+
+        mimetype, extension, writer = FORMATS[fmt]
+        rows = cat.query(**query)
+        headers['Content-Disposition'] = f'attachment; filename="surveys_data.{extension}"'
+        return Response(stream_with_context(writer(cat.frame, rows)), mimetype=mimetype, headers=headers)
+
+    server.add_url_rule('/export/<fmt>', 'download_filtered_data', download_filtered_data)
@@ -0,0 +1,70 @@
+""" Bounded LRU/TTL cache for rendered figures, keyed on the normalised filter state. """
+import threading
+import time
+from collections import OrderedDict
+
+from filters import nspec_threshold
+from search import query_terms
+
+
+def filter_key(status_value, facility_list, min_nspec_log, resolution_range, version, search=None):
+    """ Canonical, hashable form of the dashboard filter state for one catalogue version. """
+    if resolution_range and len(resolution_range) == 2:
+        resolution = (float(resolution_range[0]), float(resolution_range[1]))
+    else:
+        resolution = None
+    return (frozenset(status_value or ()), frozenset(facility_list or ()),
+            nspec_threshold(min_nspec_log), resolution, version, query_terms(search))
+
+
+class FigureCache:
+    """ Thread-safe LRU cache with a per-entry time-to-live.
+
+    Holds at most `maxsize` entries; entries older than `ttl` seconds are treated as
+    misses. Hit and miss counts are available from stats().
+    """
+
+    def __init__(self, maxsize=128, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,421 @@
+""" Figure construction for the survey scatter plot.
+
+Everything that does not depend on the filter state (constant-Nspec guide lines,
+the non-physical sky area, axis titles and styling) is built once into a base
+figure. Survey traces occupy one fixed slot per selection wavelength, so after the
+first render a filter change only needs a Patch carrying the slots' data arrays and
+the new axis ranges.
+
+Large result sets are drawn at a reduced level of detail (see figure_update), and
+zooming in re-sends the surveys inside the new view in full.
+
+In the compact encoding (SPECSURVEYS_COMPACT_FIGURES) every slot instead holds all
+surveys of its wavelength, with their labels and hover data, from the first render on;
+filter changes only patch the rounded coordinates, with null for hidden surveys.
+"""
+import numpy as np
+from dash import Patch
+import plotly.express as px
+import plotly.graph_objects as go
+
+from settings import LABEL_TOP_N, LOD_BINS, WEBGL_THRESHOLD
+
+# Significant digits kept by the compact encoding: well below a pixel even zoomed in 100x
+DISPLAY_DIGITS = 4
+
+max_area = 41252.96 # 4pi steradians in deg^2
+area_range = np.logspace(-2, np.log10(max_area), 100)
+ntotal = [1000, 1e4, 1e5, 1e6, 1e7, 1e8]
+density = [nt / area_range for nt in ntotal]
+
+colors = px.colors.sequential.Magma_r
+
+custom_data = ['Full Name', 'Reference', 'Nspec', 'Area', 'Resolution', 'Survey Status', 'Notes']
+
+hovertemplate = (r"<b>%{customdata[0]}</b><br>" +
+                 "Reference: %{customdata[1]}<br>" +
+                 "Status: <i>%{customdata[5]}</i><br><br>" +
+                 r"N<sub>spec</sub> = %{customdata[2]:,.2s} over %{customdata[3]:,.2r} deg²<br>" +
+                 r"Spectral Resolution: R ~ %{customdata[4]}<br>" +
+                 "Selection notes: %{customdata[6]}<br><br>" +
+                 "<i>Click to open reference</i>" +
+                 "<extra></extra>")
+
+
+def build_base_figure(compact=False):
+    """ Static figure skeleton: guide lines, shading, axis titles and styling, no survey data.
+
+    compact draws each guide line (straight on the log axes) from its two end points only.
+    """
+    guide_area = area_range[[0, -1]] if compact else area_range
+    fig = go.Figure(layout=dict(template="simple_white", width=700, height=500,
+                                xaxis=dict(anchor='y', domain=[0.0, 1.0], type='log'),
+                                yaxis=dict(anchor='x', domain=[0.0, 1.0], type='log'),
+                                legend=dict(tracegroupgap=0),
+                                # Keep the user's zoom when only the trace data is patched
+                                uirevision='surveys'))
+    # Add lines for constant Nspec
+    for nt in ntotal:
+        fig.add_scatter(x=guide_area, y=nt / guide_area,
+                        mode='lines',
+                        line=dict(color='#B5B5B5', width=2, dash="dash"),
+                        showlegend=False,
+                        name=f"n={nt}", zorder=0)
+
+    # Fill non-physical sky areas
+    fig.add_vrect(x0=max_area, x1=100000, line_width=0, fillcolor="red", opacity=0.1)
+
+    fig.update_layout(
+        #title="Galaxy and Cosmology Surveys",
+        xaxis_title=r"$$\mathsf{Survey\,area}\,(\mathsf{deg}^{\mathsf{2}})$$",
+        yaxis_title=r"$$\mathsf{Source\,density}\,(\mathsf{deg}^{\mathsf{-2}})$$",
+        font=dict(
+            family="Roboto, sans-serif",
+            size=14,
+            color="black"
+        ),
+        xaxis={'showgrid': True},
+        yaxis={'showgrid': True},
+        margin=dict(l=20, r=10, t=20, b=40),
+        legend=dict(title='Selection Wavelength:', orientation='v', y=0.02, x=0.02,
+                    font=dict(size=10.5)),
+    )
+    fig.update_xaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
+                     showline=True, linewidth=1, linecolor='black', mirror=True,
+                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
+    fig.update_yaxes(ticklen=8, tickcolor="black", tickmode='auto', nticks=10, showgrid=True,
+                     showline=True, linewidth=1, linecolor='black', mirror=True,
+                     minor=dict(ticklen=4, tickcolor="black", tickmode='auto', nticks=10, showgrid=True))
+
+    # Plain lists serialise faster than numpy arrays and never need converting again
+    base = fig.to_plotly_json()
+    for trace in base['data']:
+        trace['x'], trace['y'] = trace['x'].tolist(), trace['y'].tolist()
+    return base
+
+
+def slot_data(group_df, trace_type='scatter', label_nspec=None):
+    """ The parts of one survey trace that depend on the filters.
+
+    With label_nspec set, only surveys with at least that many spectra are labelled.
+    """
+    if group_df is None or len(group_df) == 0:
+        return {'type': trace_type, 'x': [], 'y': [], 'text': [], 'customdata': [], 'showlegend': False}
+    text = group_df['Survey']
+    if label_nspec is not None:
+        text = text.where(group_df['Nspec'] >= label_nspec, '')
+    return {'type': trace_type,
+            'x': group_df['Area'].tolist(), 'y': group_df['Density'].tolist(),
+            'text': text.tolist(),
+            'customdata': group_df[custom_data].values.tolist(),
+            'showlegend': True}
+
+
+def survey_trace(name, color, data):
+    return {
+        'type': 'scatter', 'mode': 'markers+text',
+        'name': name, 'legendgroup': name, 'orientation': 'v',
+        **data,
+        'hovertemplate': hovertemplate,
+        'marker': {'color': color, 'symbol': 'circle', 'size': 10,
+                   'line': {'color': 'DarkSlateGrey', 'width': 1}},
+        'textposition': 'bottom center', 'textfont': {'size': 10},
+        'xaxis': 'x', 'yaxis': 'y',
+    }
+
+
+def axis_ranges(filtered_df):
+    """ Log-space [x_min, x_max], [y_min, y_max] framing the filtered surveys. """
+    if len(filtered_df) > 0:
+        # Get min/max values from filtered data
+        min_area = filtered_df['Area'].min()
+        max_area_data = filtered_df['Area'].max()
+        min_density = filtered_df['Density'].min()
+        max_density = filtered_df['Density'].max()
+
+        # Set lower limits to be a factor of 2 below the minimum values (in log space)
+        x_min = np.log10(min_area) - np.log10(2)  # Factor of 2 below minimum area
+        y_min = np.log10(min_density) - np.log10(2)  # Factor of 2 below minimum density
+
+        # Set upper limits with some padding above maximum values
+        x_max = min(np.log10(max_area_data) + 0.5, 4.7)  # Keep original upper limit or extend
+        y_max = min(np.log10(max_density) + 0.5, 5.2)   # Keep original upper limit or extend
+
+        # Ensure reasonable minimum bounds
+        x_min = max(x_min, -2.0)  # Don't go below 0.01 deg²
+        y_min = max(y_min, -2.0)  # Don't go below 0.01 deg⁻²
+    else:
+        # If no data points, use default ranges
+        x_min, x_max = -1.2, 4.7
+        y_min, y_max = -1, 5.2
+    return [float(x_min), float(x_max)], [float(y_min), float(y_max)]
+
+
+### Level of detail for large result sets
+def log_coordinates(df):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.log10(df['Area'].to_numpy(dtype=float)), np.log10(df['Density'].to_numpy(dtype=float))
+
+
+def merge_viewport(viewport, relayout_data):
+    """ The [x_min, x_max, y_min, y_max] view (log10 units, None = autoscaled) after a plotly
+    relayout event; None when both axes show the full range.
+    """
+    relayout_data = relayout_data or {}
+    merged = list(viewport or [None] * 4)
+    for i, axis in ((0, 'xaxis'), (2, 'yaxis')):
+        if relayout_data.get(f'{axis}.autorange'):
+            merged[i:i + 2] = [None, None]
+        elif f'{axis}.range' in relayout_data:
+            merged[i:i + 2] = relayout_data[f'{axis}.range']
+        elif f'{axis}.range[0]' in relayout_data or f'{axis}.range[1]' in relayout_data:
+            merged[i:i + 2] = [relayout_data.get(f'{axis}.range[0]', merged[i]),
+                               relayout_data.get(f'{axis}.range[1]', merged[i + 1])]
+    merged = [None if value is None else float(value) for value in merged]
+    return None if all(value is None for value in merged) else merged
+
+
+def in_viewport(df, viewport, margin=0.1):
+    """ Mask of the surveys inside the viewport, widened by `margin` of its span so small pans stay populated. """
+    keep = np.ones(len(df), dtype=bool)
+    for values, (lo, hi) in zip(log_coordinates(df), (viewport[:2], viewport[2:])):
+        if lo is not None and hi is not None:
+            lo, hi = lo - margin * (hi - lo), hi + margin * (hi - lo)
+        if lo is not None:
+            keep &= values >= lo
+        if hi is not None:
+            keep &= values <= hi
+    return keep
+
+
+def grid_cells(values, bins):
+    span = np.ptp(values)
+    if span == 0:
+        return np.zeros(len(values), dtype=np.int64)
+    return np.minimum(((values - values.min()) / span * bins).astype(np.int64), bins - 1)
+
+
+def decimate_positions(df, bins=LOD_BINS):
+    """ Thin out overlapping markers: per selection wavelength, keep the survey with the most
+    spectra in each cell of a bins x bins grid over log(Area) and log(Density).
+
+    Returns the ascending positions of the kept rows in df.
+    """
+    x, y = log_coordinates(df)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(finite) == 0:
+        return finite
+    x, y = x[finite], y[finite]
+    slot = df['Selection Wavelength'].cat.codes.to_numpy()[finite].astype(np.int64)
+    cell = (slot * bins + grid_cells(x, bins)) * bins + grid_cells(y, bins)
+    # Most spectra first, so np.unique keeps that survey as each cell's representative
+    order = np.argsort(-df['Nspec'].to_numpy(dtype=float)[finite], kind='stable')
+    _, first = np.unique(cell[order], return_index=True)
+    return finite[np.sort(order[first])]
+
+
+def decimate(df, bins=LOD_BINS):
+    return df.iloc[decimate_positions(df, bins)]
+
+
+def label_threshold(df, top_n=LABEL_TOP_N):
+    """ Smallest Nspec among the top_n surveys with the most spectra. """
+    if len(df) <= top_n:
+        return None
+    if top_n <= 0:
+        return np.inf
+    return np.sort(df['Nspec'].to_numpy(dtype=float))[-top_n]
+
+
+def figure_update(filtered_df, slots, viewport=None):
+    """ Trace data per wavelength slot and axis ranges for one filter state.
+
+    If more than WEBGL_THRESHOLD surveys fall inside the viewport (the whole plot when
+    None) they are drawn with WebGL, decimated and only the LABEL_TOP_N with the most
+    spectra are labelled. The axis ranges always frame the whole filtered set.
+    """
+    xaxis_range, yaxis_range = axis_ranges(filtered_df)
+    shown = filtered_df if viewport is None else filtered_df[in_viewport(filtered_df, viewport)]
+    trace_type, label_nspec = 'scatter', None
+    if len(shown) > WEBGL_THRESHOLD:
+        shown = decimate(shown)
+        trace_type, label_nspec = 'scattergl', label_threshold(shown)
+    groups = dict(list(shown.groupby('Selection Wavelength', sort=False, observed=True)))
+    return {'traces': [slot_data(groups.get(name), trace_type, label_nspec) for name in slots],
+            'xaxis_range': xaxis_range, 'yaxis_range': yaxis_range}
+
+
+def full_figure(base, slots, update):
+    """ Complete figure: one survey trace per slot (coloured by slot) followed by the base figure. """
+    traces = [survey_trace(name, colors[i % len(colors)], data)
+              for i, (name, data) in enumerate(zip(slots, update['traces']))]
+    layout = dict(base['layout'])
+    layout['xaxis'] = {**layout['xaxis'], 'range': update['xaxis_range']}
+    layout['yaxis'] = {**layout['yaxis'], 'range': update['yaxis_range']}
+    return {'data': traces + base['data'], 'layout': layout}
+
+
+def figure_patch(update, with_ranges=True):
+    """ Partial update of a figure built by full_figure(): only trace data and (optionally) axis ranges. """
+    patched = Patch()
+    for i, data in enumerate(update['traces']):
+        for prop, value in data.items():
+            patched['data'][i][prop] = value
+    if with_ranges:
+        patched['layout']['xaxis']['range'] = update['xaxis_range']
+        patched['layout']['yaxis']['range'] = update['yaxis_range']
+    return patched
+
+
+### Compact encoding
+def round_significant(values, digits=DISPLAY_DIGITS):
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        scale = 10.0 ** (digits - 1 - np.floor(np.log10(np.abs(values))))
+        rounded = np.round(values * scale) / scale
+    return np.where(np.isfinite(rounded), rounded, values)
+
+
+def slot_bounds(catalogue):
+    """ [start, stop) of each wavelength slot's rows; the catalogue frame is sorted by wavelength. """
+    codes = catalogue.frame['Selection Wavelength'].cat.codes.to_numpy()
+    slots = np.arange(len(catalogue.wavelengths))
+    return list(zip(np.searchsorted(codes, slots, side='left').tolist(),
+                    np.searchsorted(codes, slots, side='right').tolist()))
+
+
+def masked(values, visible):
+    """ Plain list with None (JSON null, not drawn by plotly) wherever visible is False. """
+    return np.where(visible, values, None).tolist()
+
+
+def label_trace(data):
+    """ Text-only trace labelling the surveys with the most spectra in level-of-detail mode. """
+    return {'type': 'scatter', 'mode': 'text', 'name': 'labels', 'showlegend': False, 'hoverinfo': 'skip',
+            'x': [], 'y': [], 'text': [], **data,
+            'textposition': 'bottom center', 'textfont': {'size': 10},
+            'xaxis': 'x', 'yaxis': 'y'}
+
+
+def compact_update(catalogue, rows, viewport=None):
+    """ figure_update() for the compact encoding, from the positions of the filtered surveys.
+
+    Each slot gets x/y over all of its surveys (None where hidden). Above WEBGL_THRESHOLD
+    surveys in view the slots lose their per-point labels and the labels trace carries the
+    LABEL_TOP_N surveys with the most spectra instead.
+    """
+    frame = catalogue.frame
+    filtered_df = frame.iloc[rows]
+    xaxis_range, yaxis_range = axis_ranges(filtered_df)
+    shown = rows if viewport is None else rows[in_viewport(filtered_df, viewport)]
+    trace_type, mode, labelled = 'scatter', 'markers+text', shown[:0]
+    if len(shown) > WEBGL_THRESHOLD:
+        shown = shown[decimate_positions(frame.iloc[shown])]
+        label_nspec = label_threshold(frame.iloc[shown])
+        nspec = frame['Nspec'].to_numpy(dtype=float)
+        labelled = shown if label_nspec is None else shown[nspec[shown] >= label_nspec]
+        trace_type, mode = 'scattergl', 'markers'
+
+    visible = np.zeros(len(frame), dtype=bool)
+    visible[shown] = True
+    x, y = round_significant(frame['Area']), round_significant(frame['Density'])
+    traces = [{'type': trace_type, 'mode': mode,
+               'x': masked(x[start:stop], visible[start:stop]), 'y': masked(y[start:stop], visible[start:stop]),
+               'showlegend': bool(visible[start:stop].any())}
+              for start, stop in slot_bounds(catalogue)]
+    labels = {'type': trace_type, 'x': x[labelled].tolist(), 'y': y[labelled].tolist(),
+              'text': frame['Survey'].to_numpy()[labelled].tolist()}
+    return {'traces': traces, 'labels': labels, 'xaxis_range': xaxis_range, 'yaxis_range': yaxis_range}
+
+
+def full_compact_figure(base, catalogue, update):
+    """ Complete compact figure: slot traces carrying every survey's label and hover data once,
+    the labels trace, then the base figure.
+    """
+    frame = catalogue.frame
+    text = frame['Survey'].tolist()
+    customdata = frame[custom_data].values.tolist()
+    traces = [survey_trace(name, colors[i % len(colors)],
+                           {**data, 'text': text[start:stop], 'customdata': customdata[start:stop]})
+              for i, (name, data, (start, stop))
+              in enumerate(zip(catalogue.wavelengths, update['traces'], slot_bounds(catalogue)))]
+    layout = dict(base['layout'])
+    layout['xaxis'] = {**layout['xaxis'], 'range': update['xaxis_range']}
+    layout['yaxis'] = {**layout['yaxis'], 'range': update['yaxis_range']}
+    return {'data': traces + [label_trace(update['labels'])] + base['data'], 'layout': layout}
+
+
+def compact_patch(update, with_ranges=True):
+    """ Partial update of a figure built by full_compact_figure(). """
+    patched = figure_patch(update, with_ranges)
+    for prop, value in update['labels'].items():
+        patched['data'][len(update['traces'])][prop] = value
+    return patched
+
+
+def compact_catalogue(catalogue, base):
+    """ Everything the browser needs to filter and draw the plot itself (client-side mode).
+
+    Columns are plain lists in catalogue order; 'status' and 'facility' are codes into
+    'statuses' and 'facilities', 'slot' is each survey's trace slot and 'traces' holds
+    the empty slot traces that the client fills in.
+    """
+    df = catalogue.frame
+    empty = slot_data(None)
+    return {
+        'version': catalogue.version,
+        'base': base,
+        'statuses': list(df['Survey Status'].cat.categories),
+        'facilities': list(df['Facility'].cat.categories),
+        'traces': [survey_trace(name, colors[i % len(colors)], empty)
+                   for i, name in enumerate(catalogue.wavelengths)],
+        # The browser has every point anyway, so it only switches to WebGL and limits the labels
+        'webgl_threshold': WEBGL_THRESHOLD,
+        'label_top_n': LABEL_TOP_N,
+        'columns': {
+            'slot': df['Selection Wavelength'].cat.codes.tolist(),
+            'status': df['Survey Status'].cat.codes.tolist(),
+            'facility': df['Facility'].cat.codes.tolist(),
+            'nspec': df['Nspec'].tolist(),
+            'resolution': df['Resolution'].tolist(),
+            'x': df['Area'].tolist(),
+            'y': df['Density'].tolist(),
+            'text': df['Survey'].tolist(),
+            'customdata': df[custom_data].values.tolist(),
+        },
+    }
+
+
+### Summary charts, read from the catalogue's aggregate cube (aggregates.py)
+status_colors = {'Complete': '#2d5c99', 'Ongoing': '#3a9d5d', 'Proposed / Planned': '#e0892c',
+                 'Special / Unfinished': '#a0a0a0'}
+measure_titles = {'Surveys': 'Surveys', 'Nspec': 'Spectra', 'Area': 'Survey area (deg²)'}
+
+
+# The look of the simple_white template, without sending the whole template with every update
+summary_axis = {'showline': True, 'linecolor': 'black', 'ticks': 'outside', 'zeroline': False}
+summary_layout = dict(paper_bgcolor='white', plot_bgcolor='white', height=350, barmode='stack',
+                      font=dict(family="Roboto, sans-serif", size=12, color="black"),
+                      margin=dict(l=20, r=10, t=20, b=40),
+                      legend=dict(title=dict(text='Survey status:'), orientation='h', y=1.08, x=0))
+
+
+def summary_figure(table, by, measure, groups):
+    """ Bars of one measure for each of `groups` (values of `by`), stacked by survey status.
+
+    table is a cube rollup by [by, 'Survey Status'], or by [by] alone when by is the status.
+    """
+    statuses = set(table['Survey Status']) if len(table) else set()
+    data = []
+    for status, color in status_colors.items():
+        if status not in statuses:
+            continue
+        rows = table[table['Survey Status'] == status].set_index(by).reindex(groups)
+        data.append({'type': 'bar', 'x': groups, 'y': rows[measure].fillna(0).tolist(), 'name': status,
+                     'marker': {'color': color},
+                     'hovertemplate': f"%{{x}}<br>{status}: %{{y:,.3s}}<extra></extra>"})
+    layout = {**summary_layout,
+              'xaxis': {**summary_axis, 'categoryorder': 'array', 'categoryarray': groups},
+              'yaxis': {**summary_axis, 'title': {'text': measure_titles[measure]}, 'showgrid': True,
+                        'gridcolor': '#e5e5e5'}}
+    return {'data': data, 'layout': layout}
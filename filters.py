@@ -0,0 +1,131 @@
+""" Precomputed filter index shared by the plot, the CSV download and any other query path.
+
+Built once per catalogue version. Categorical filters (survey status, facility,
+selection wavelength) use one precomputed boolean mask per value; the Nspec and
+resolution range filters use sorted copies of those columns queried by binary
+search, so a range query only touches the rows inside the range.
+"""
+import math
+
+import numpy as np
+
+
+def nspec_threshold(min_nspec_log):
+    """ Smallest whole Nspec passing a log10 minimum from the Nspec slider or the nspec parameter.
+
+    Nspec is a count, so filtering on this integer gives the same rows as 10 ** min_nspec_log
+    itself. The tolerance absorbs rounding in log10 and back, so a survey whose exact Nspec
+    was typed in (sync_nspec_inputs puts log10(value) on the slider) is never lost.
+    """
+    return math.ceil(10 ** float(min_nspec_log) * (1 - 1e-12))
+
+
+def value_masks(values):
+    """ {value: boolean mask} for a categorical column. """
+    codes = values.cat.codes.to_numpy()
+    return {value: codes == code for code, value in enumerate(values.cat.categories)}
+
+
+class SortedColumn:
+    """ Row positions ordered by one numeric column, for range queries by binary search. """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.order = np.argsort(values, kind='stable')
+        self.sorted = values[self.order]
+        # Position of every row within self.order, to test range membership of arbitrary rows
+        self.rank = np.empty(len(values), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(values))
+        # NaNs sort to the end; keep them out of every range
+        self.valid = int(np.count_nonzero(~np.isnan(self.sorted)))
+
+    def bounds(self, lo=None, hi=None):
+        """ Slice [start, stop) of self.order holding the rows with lo <= value <= hi. """
+        start = 0 if lo is None else int(np.searchsorted(self.sorted[:self.valid], lo, side='left'))
+        stop = self.valid if hi is None else int(np.searchsorted(self.sorted[:self.valid], hi, side='right'))
+        return start, max(start, stop)
+
+
+class FilterIndex:
+    def __init__(self, df, version=None):
+        self.version = version
+        self.size = len(df)
+        self.status = value_masks(df['Survey Status'])
+        self.facility = value_masks(df['Facility'])
+        self.wavelength = value_masks(df['Selection Wavelength'])
+        self.nspec = SortedColumn(df['Nspec'])
+        self.resolution = SortedColumn(df['Resolution'])
+
+    @staticmethod
+    def _any(masks, values, rows):
+        """ Which of `rows` match any of `values`, OR-ing the per-value masks. """
+        keep = np.zeros(len(rows), dtype=bool)
+        for value in values:
+            mask = masks.get(value)
+            if mask is not None:
+                keep |= mask[rows]
+        return keep
+
+    def query(self, status=None, facilities=None, min_nspec=None, resolution=None, wavelengths=None):
+        """ Positions (ascending) of the rows passing every given filter.
+
+        status, facilities and wavelengths are collections of accepted values; None, or
+        for facilities an empty list, means no restriction. min_nspec is a lower bound
+        on Nspec and resolution an inclusive (min, max) pair.
+        """
+        ranges = [(self.nspec, self.nspec.bounds(lo=min_nspec))]
+        if resolution is not None and len(resolution) == 2:
+            ranges.append((self.resolution, self.resolution.bounds(*resolution)))
+
+        # Drive the query from the narrowest range and check everything else on those rows only
+        ranges.sort(key=lambda r: r[1][1] - r[1][0])
+        (column, (start, stop)), others = ranges[0], ranges[1:]
+        rows = np.sort(column.order[start:stop])
+
+        for other, (start, stop) in others:
+            rank = other.rank[rows]
+            rows = rows[(rank >= start) & (rank < stop)]
+
+        if status is not None:
+            rows = rows[self._any(self.status, status, rows)]
+        if facilities:
+            rows = rows[self._any(self.facility, facilities, rows)]
+        if wavelengths is not None:
+            rows = rows[self._any(self.wavelength, wavelengths, rows)]
+        return rows
+
+
+def split_values(args, name, sep=','):
+    """ All values of a repeatable query parameter, optionally also splitting each on sep. """
+    if name not in args:
+        return None
+    items = args.getlist(name)
+    if sep:
+        items = [value for item in items for value in item.split(sep)]
+    return [value.strip() for value in items if value.strip()]
+
+
+def parse_filter_args(args):
+    """ Catalogue.query() keywords from request query parameters (a werkzeug MultiDict).
+
+    Accepts the dashboard filters: status and wavelength (repeated or comma-separated),
+    facility (repeated only, as names may contain commas), nspec (log10 of the minimum Nspec, as on the slider) or min_nspec,
+    resolution as 'min,max' and a free-text search as q. Raises ValueError for malformed values.
+    """
+    query = {'status': split_values(args, 'status'),
+             'facilities': split_values(args, 'facility', sep=None),
+             'wavelengths': split_values(args, 'wavelength'),
+             'search': args.get('q', '').strip() or None}
+    try:
+        if 'nspec' in args:
+            query['min_nspec'] = nspec_threshold(args['nspec'])
+        elif 'min_nspec' in args:
+            query['min_nspec'] = float(args['min_nspec'])
+        if 'resolution' in args:
+            resolution = [float(value) for value in args['resolution'].split(',')]
+            if len(resolution) != 2:
+                raise ValueError
+            query['resolution'] = resolution
+    except (ValueError, OverflowError):
+        raise ValueError("nspec/min_nspec must be numbers and resolution must be 'min,max'") from None
+    return query
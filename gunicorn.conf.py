@@ -0,0 +1,38 @@
+""" gunicorn settings, picked up automatically when gunicorn is started in this directory:
+
+    gunicorn
+
+The catalogue, figure skeleton and page layout are built once in the master process
+(preload_app) and the forked workers share them copy-on-write, so workers boot
+without re-reading the surveys and each one adds little memory of its own.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'app:create_server(watch=False)'
+preload_app = True
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('SPECSURVEYS_THREADS', 4))
+
+# No collections while the app is preloaded; before every fork pre_fork moves everything it
+# built into the permanent generation, so the workers' collectors never write to (and un-share)
+# those pages. This file is run again on SIGHUP, which disables collection again until the
+# next fork, so the collector is switched back on there rather than once in when_ready.
+gc.disable()
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+    gc.enable()
+
+
+def post_fork(server, worker):
+    # The reload watcher is a thread, and threads do not survive fork(): start one per worker.
+    # Each worker has its own catalogue, and the watchers keep them all on the same version.
+    from settings import RELOAD_INTERVAL, RELOAD_TOKEN
+    if RELOAD_INTERVAL > 0 or RELOAD_TOKEN:
+        server.app.wsgi().extensions['catalogue_store'].watch(RELOAD_INTERVAL)
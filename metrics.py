@@ -0,0 +1,253 @@
+""" Request timings, payload sizes and cache/catalogue statistics in the Prometheus text format.
+
+GET /metrics
+
+    specsurveys_callback_seconds{callback=...}   wall time per Dash callback or route, streaming included
+    specsurveys_response_bytes{callback=...}     response payload size (before any compression)
+    specsurveys_figure_cache_*                   figure cache hits, misses, size and hit ratio
+    specsurveys_catalogue_*                      rows, load time and version of the current catalogue
+
+Dash callbacks are labelled with the callback function's name (update_bar_chart,
+sync_nspec_inputs) and other routes with their endpoint (download_filtered_data,
+api_surveys, ...). The values are per process: under gunicorn each scrape reports the
+worker that served it.
+
+Setting SPECSURVEYS_PROFILE_SLOWEST=N also runs a sample of requests under cProfile and
+keeps the stats of the N slowest in SPECSURVEYS_PROFILE_DIR (open with pstats or snakeviz).
+"""
+import bisect
+import cProfile
+import heapq
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from flask import Response, g, request
+
+from settings import PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_SLOWEST
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTE_BUCKETS = (100, 1000, 10000, 30000, 100000, 300000, 1000000, 3000000, 10000000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """ Cumulative-bucket histogram with one series per label value. """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, label, buckets=TIME_BUCKETS):
+        self.name, self.help, self.label = name, help, label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            counts, total = self._series.get(label_value, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[label_value] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for label_value, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {self.label: label_value, 'le': format_value(bound)}, cumulative
+            yield f'{self.name}_sum', {self.label: label_value}, total
+            yield f'{self.name}_count', {self.label: label_value}, cumulative
+
+
+class Sampled:
+    """ Counter or gauge whose current (labels, value) pairs are read from a function at scrape time. """
+
+    def __init__(self, name, help, type, read):
+        self.name, self.help, self.type, self.read = name, help, type, read
+
+    def samples(self):
+        for labels, value in self.read():
+            yield self.name, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{format_labels(labels)} {format_value(value)}'
+                         for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class CountingIterable:
+    """ Wraps a streamed response body, counting the bytes sent. """
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+### Sampling profiler
+class SlowestProfiles:
+    """ cProfile a random sample of requests and keep the stats files of the `keep` slowest. """
+
+    def __init__(self, keep, sample_rate, directory):
+        self.keep, self.sample_rate, self.directory = keep, sample_rate, directory
+        self._slowest = []  # min-heap of (seconds, path)
+        self._lock = threading.Lock()
+        # One request at a time: cProfile cannot run in several threads at once on every Python
+        self._active = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def discard(self, profiler):
+        profiler.disable()
+        self._active.release()
+
+    def finish(self, profiler, seconds, label):
+        self.discard(profiler)
+        with self._lock:
+            if len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]:
+                return
+            name = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', label)}-{seconds * 1000:.0f}ms-{time.time_ns()}.prof"
+            path = os.path.join(self.directory, name)
+            profiler.dump_stats(path)
+            if len(self._slowest) >= self.keep:
+                _, evicted = heapq.heapreplace(self._slowest, (seconds, path))
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+            else:
+                heapq.heappush(self._slowest, (seconds, path))
+        logger.info("Saved profile of a %.0f ms %s request to %s", seconds * 1000, label, path)
+
+
+def register_metrics(app, catalogue_store, figure_cache):
+    """ Instrument every request of the Dash app's server and add the /metrics route. """
+    server = app.server
+    registry = Registry()
+    callback_seconds = registry.add(Histogram(
+        'specsurveys_callback_seconds', "Wall time of Dash callbacks and other routes, streaming included.",
+        'callback'))
+    response_bytes = registry.add(Histogram(
+        'specsurveys_response_bytes', "Response payload size before compression.", 'callback', BYTE_BUCKETS))
+
+    def cache_stats(*fields):
+        return lambda: [({}, figure_cache.stats()[field]) for field in fields]
+
+    registry.add(Sampled('specsurveys_figure_cache_hits_total', "Figure cache hits.", 'counter',
+                         cache_stats('hits')))
+    registry.add(Sampled('specsurveys_figure_cache_misses_total', "Figure cache misses.", 'counter',
+                         cache_stats('misses')))
+    registry.add(Sampled('specsurveys_figure_cache_entries', "Figure updates held in the cache.", 'gauge',
+                         cache_stats('entries')))
+    registry.add(Sampled('specsurveys_figure_cache_hit_ratio', "Figure cache hits / lookups.", 'gauge',
+                         cache_stats('hit_rate')))
+    registry.add(Sampled('specsurveys_catalogue_rows', "Surveys in the current catalogue.", 'gauge',
+                         lambda: [({}, len(catalogue_store.current.frame))]))
+    registry.add(Sampled('specsurveys_catalogue_load_seconds', "Time taken to load the current catalogue.", 'gauge',
+                         lambda: [({}, catalogue_store.load_seconds)]))
+    registry.add(Sampled('specsurveys_catalogue_info', "Version of the current catalogue.", 'gauge',
+                         lambda: [({'version': catalogue_store.current.version}, 1)]))
+
+    profiles = SlowestProfiles(PROFILE_SLOWEST, PROFILE_SAMPLE_RATE, PROFILE_DIR) if PROFILE_SLOWEST > 0 else None
+
+    def request_label():
+        """ Dash callback name for /_dash-update-component requests, otherwise the Flask endpoint. """
+        if request.endpoint and request.path.endswith('_dash-update-component'):
+            body = request.get_json(silent=True) or {}
+            callback = app.callback_map.get(body.get('output'), {}).get('callback')
+            return getattr(callback, '__name__', 'unknown_callback')
+        return request.endpoint or 'not_found'
+
+    @server.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        # Scrapes of /metrics are neither timed nor profiled
+        g.metrics_profiler = profiles.start() if profiles and request.endpoint != 'metrics' else None
+
+    @server.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        profiler = g.pop('metrics_profiler', None)
+        if start is None or request.endpoint == 'metrics':
+            if profiler is not None:
+                profiles.discard(profiler)
+            return response
+        label = request_label()
+        if response.is_streamed:
+            body = response.response = CountingIterable(response.response)
+        else:
+            body = None
+            response_bytes.observe(label, response.calculate_content_length() or 0)
+
+        # After the last byte has been sent, for streamed exports too
+        def finished():
+            seconds = time.perf_counter() - start
+            callback_seconds.observe(label, seconds)
+            if body is not None:
+                response_bytes.observe(label, body.bytes)
+            if profiler is not None:
+                profiles.finish(profiler, seconds, label)
+
+        response.call_on_close(finished)
+        return response
+
+    # A request that failed before after_request still has to stop its profiler
+    @server.teardown_request
+    def discard_profile(exc):
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiles.discard(profiler)
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return registry
@@ -0,0 +1,142 @@
+""" Inverted index for free-text survey search, built once per catalogue version.
+
+Survey, Full Name, Instrument, Facility and Notes are split into lower-case word tokens
+(accents removed). Every token keeps a posting list of the rows it appears in, with the
+weight of the most important field it appears in there. The posting lists are stored
+back to back in alphabetical token order, so all tokens starting with a prefix form one
+contiguous slice, found by binary search on the sorted vocabulary.
+
+A query matches the surveys containing every query word, each as a word prefix, so
+results update as the user types ('gal' finds 'galaxy' and 'GALEX'). Results are ranked
+by the summed field weights of the matched words, whole-word matches counting double
+and an exact survey name more, then by Nspec.
+"""
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+
+# Field weights: a word in the survey's name matters more than one in its notes
+FIELD_WEIGHTS = {'Survey': 8.0, 'Full Name': 4.0, 'Facility': 2.0, 'Instrument': 2.0, 'Notes': 1.0}
+# Fields whose words are also indexed run together ('SDSS-IV' is found by 'sdssiv' too)
+JOINED_FIELDS = ('Survey', 'Instrument')
+# Share of a word's weight given to a query word that is only a prefix of it
+PREFIX_SHARE = 0.5
+# Added to surveys whose name is exactly the query
+NAME_BONUS = 100.0
+
+token_pattern = re.compile(r'[^\W_]+')
+
+
+def normalise(text):
+    """ Case-folded text without accents. """
+    text = str(text).casefold()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return token_pattern.findall(normalise(text))
+
+
+def query_terms(query):
+    """ The distinct words of a search query, in order (the canonical form used in cache keys). """
+    return tuple(dict.fromkeys(tokenize(query or '')))
+
+
+class SearchIndex:
+    def __init__(self, df):
+        self.size = len(df)
+        self.nspec = np.asarray(df['Nspec'], dtype=np.float64)
+
+        vocab, tokens, rows, weights = {}, [], [], []
+        for field, weight in FIELD_WEIGHTS.items():
+            if field not in df:
+                continue
+            for row, value in enumerate(df[field].tolist()):
+                if not isinstance(value, str) or not value:
+                    continue
+                words = set(tokenize(value))
+                if field in JOINED_FIELDS and len(words) > 1:
+                    words.add(''.join(tokenize(value)))
+                for word in words:
+                    tokens.append(vocab.setdefault(word, len(vocab)))
+                rows.extend([row] * len(words))
+                weights.extend([weight] * len(words))
+
+        # Renumber the tokens alphabetically, so a prefix covers a contiguous range of ids
+        self.words = sorted(vocab)
+        renumber = np.empty(len(vocab), dtype=np.int64)
+        renumber[[vocab[word] for word in self.words]] = np.arange(len(self.words))
+        tokens = renumber[np.asarray(tokens, dtype=np.int64)]
+        rows = np.asarray(rows, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # One posting per (token, row), with the weight of the best field
+        order = np.lexsort((-weights, rows, tokens))
+        tokens, rows, weights = tokens[order], rows[order], weights[order]
+        first = np.ones(len(tokens), dtype=bool)
+        first[1:] = (tokens[1:] != tokens[:-1]) | (rows[1:] != rows[:-1])
+        self.rows, self.weights = rows[first], weights[first]
+        # Postings of token i are rows[offsets[i]:offsets[i + 1]]
+        self.offsets = np.searchsorted(tokens[first], np.arange(len(self.words) + 1))
+
+        self.names = {}
+        for row, name in enumerate(df['Survey'].tolist()):
+            self.names.setdefault(' '.join(tokenize(name)), []).append(row)
+
+    def prefix_range(self, term):
+        """ Token ids [start, stop) of the words starting with term. """
+        start = bisect.bisect_left(self.words, term)
+        # Every word starting with term sorts before term followed by the highest code point
+        stop = bisect.bisect_left(self.words, term + '\U0010ffff', lo=start)
+        return start, stop
+
+    def term_scores(self, term):
+        """ Score of every row for one query word: prefix matches at PREFIX_SHARE, whole words in full. """
+        start, stop = self.prefix_range(term)
+        lo, hi = self.offsets[start], self.offsets[stop]
+        scores = np.bincount(self.rows[lo:hi], weights=self.weights[lo:hi] * PREFIX_SHARE,
+                             minlength=self.size).astype(np.float64, copy=False)  # int64 when nothing matches
+        if start < stop and self.words[start] == term:
+            lo, hi = self.offsets[start], self.offsets[start + 1]
+            scores[self.rows[lo:hi]] += self.weights[lo:hi] * (1 - PREFIX_SHARE)
+        return scores
+
+    def scores(self, query):
+        """ Relevance of every row (0 where some query word is missing), or None for an empty query. """
+        terms = query_terms(query)
+        if not terms:
+            return None
+        total = None
+        for term in terms:
+            scores = self.term_scores(term)
+            total = scores if total is None else (total + scores) * ((total > 0) & (scores > 0))
+        total[self.names.get(' '.join(terms), [])] += NAME_BONUS
+        return total
+
+    def matches(self, query):
+        """ Positions (ascending) of the rows matching every word of the query. """
+        scores = self.scores(query)
+        if scores is None:
+            return np.arange(self.size)
+        return np.flatnonzero(scores)
+
+    def ranked(self, query, rows=None, limit=None):
+        """ Matching positions, best first; only among `rows` if given and at most `limit` of them. """
+        scores = self.scores(query)
+        if rows is None:
+            rows = np.arange(self.size) if scores is None else np.flatnonzero(scores)
+        elif scores is not None:
+            rows = rows[scores[rows] > 0]
+        if scores is None:
+            scores = np.zeros(self.size)
+        if limit is not None and len(rows) > limit:
+            # Only the best `limit` need sorting; the partition keeps every row tied with the last one
+            cutoff = np.partition(scores[rows], len(rows) - limit)[len(rows) - limit]
+            rows = rows[scores[rows] >= cutoff]
+        order = np.lexsort((rows, -self.nspec[rows], -scores[rows]))
+        return rows[order][:limit]
@@ -0,0 +1,43 @@
+""" Deployment settings, read from environment variables. """
+import os
+import tempfile
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Ship the catalogue to the browser once per page and filter the plot there
+# (assets/clientside.js) instead of calling back to the server on every change
+CLIENTSIDE_FILTERING = env_flag('SPECSURVEYS_CLIENTSIDE_FILTERING')
+
+# Poll surveys/ for changed files every this many seconds and hot-reload them (0 = off)
+RELOAD_INTERVAL = float(os.environ.get('SPECSURVEYS_RELOAD_INTERVAL', 0))
+
+# Token required by POST /_reload-catalogue; the endpoint is disabled when unset
+RELOAD_TOKEN = os.environ.get('SPECSURVEYS_RELOAD_TOKEN')
+
+# Send every survey's labels and hover data once per page and afterwards patch only rounded
+# coordinates (figures.compact_update), with two-point guide lines. Off by default: the first
+# figure and every patch grow with the whole catalogue, not with the surveys shown, so this
+# only pays off for small catalogues such as the bundled one
+COMPACT_FIGURES = env_flag('SPECSURVEYS_COMPACT_FIGURES')
+
+# gzip (or brotli, if installed) compress responses; turn off if a proxy in front already does
+COMPRESS_RESPONSES = env_flag('SPECSURVEYS_COMPRESS', True)
+
+# Above this many surveys in view the plot switches to WebGL (scattergl) markers, labels only the
+# LABEL_TOP_N surveys with the most spectra and keeps one survey per wavelength in each cell of a
+# LOD_BINS x LOD_BINS log(Area)/log(Density) grid; zooming in brings back full detail
+WEBGL_THRESHOLD = int(os.environ.get('SPECSURVEYS_WEBGL_THRESHOLD', 1000))
+LABEL_TOP_N = int(os.environ.get('SPECSURVEYS_LABEL_TOP_N', 50))
+LOD_BINS = int(os.environ.get('SPECSURVEYS_LOD_BINS', 60))
+
+# Run a sample (PROFILE_SAMPLE_RATE) of requests under cProfile and keep the stats of the
+# PROFILE_SLOWEST slowest in PROFILE_DIR (0 = off), see metrics.py
+PROFILE_SLOWEST = int(os.environ.get('SPECSURVEYS_PROFILE_SLOWEST', 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get('SPECSURVEYS_PROFILE_SAMPLE_RATE', 0.1))
+PROFILE_DIR = os.environ.get('SPECSURVEYS_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'specsurveys-profiles'))
@@ -0,0 +1,42 @@
+""" Shared catalogues: the real survey library and a larger synthetic one. """
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_surveys
+from catalogue import build_catalogue, frame_from_records, load_catalogue
+
+
+@pytest.fixture(scope='session')
+def real_catalogue():
+    return load_catalogue()
+
+
+@pytest.fixture(scope='session')
+def synthetic_catalogue():
+    # Below WEBGL_THRESHOLD, so the server and the browser both draw every survey
+    records = synthetic_surveys(800)
+    return build_catalogue(frame_from_records(records), [f'{i:06d}.json' for i in range(len(records))], {})
+
+
+@pytest.fixture(scope='session')
+def client():
+    # Imported here so that tests of the catalogue alone do not build the dashboard
+    from app import create_app
+    return create_app(watch=False).server.test_client()
+
+
+@pytest.fixture(params=['real', 'synthetic'])
+def catalogue(request, real_catalogue, synthetic_catalogue):
+    return real_catalogue if request.param == 'real' else synthetic_catalogue
+
+
+def random_filter_state(rng, catalogue):
+    """ Random dashboard filters: (statuses, facilities, log10 min Nspec, resolution range). """
+    statuses = list(catalogue.frame['Survey Status'].cat.categories)
+    status = [s for s in statuses if rng.random() < 0.7]
+    facilities = [f for f in catalogue.facilities if rng.random() < 0.1] if rng.random() < 0.5 else []
+    # Half the time exactly a survey's Nspec, as typed into the number input (log10 on the slider)
+    nspec = catalogue.frame['Nspec'].to_numpy()
+    nspec_log = float(np.log10(rng.choice(nspec))) if rng.random() < 0.5 else float(rng.uniform(3, 8))
+    resolution = sorted(rng.choice([0, 100, 500, 1000, 2000, 5000, 20000, 50000], size=2).tolist())
+    return status, facilities, nspec_log, resolution if rng.random() < 0.8 else None
@@ -0,0 +1,53 @@
+""" AggregateCube rollups against pandas groupby on the survey rows. """
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import MEASURES, QUANTILES, AggregateCube, label, selection_types
+from benchmarks.synthetic import synthetic_surveys
+from catalogue import frame_from_records, prepare_frame
+
+BY = [['Facility'], ['Selection Wavelength'], ['Survey Status'], ['Facility', 'Survey Status'], ['Selection Type']]
+
+
+def survey_values(frame):
+    """ The frame with the cube's dimension labels and Density, as plain columns. """
+    df = pd.DataFrame({dim: frame[dim].astype(str) for dim in ('Facility', 'Selection Wavelength', 'Survey Status')})
+    df['Selection Type'] = [label(selection_types, code) for code in frame['Selection Type']]
+    for measure in MEASURES:
+        df[measure] = frame[measure].where(frame[measure] > 0)
+    return df
+
+
+@pytest.mark.parametrize('by', BY)
+def test_rollup_matches_groupby(real_catalogue, by):
+    df = survey_values(real_catalogue.frame)
+    table = real_catalogue.cube.rollup(by).set_index(by)
+    groups = df.groupby(by)
+    np.testing.assert_array_equal(table['Surveys'], groups.size().reindex(table.index))
+    np.testing.assert_allclose(table['Nspec'], groups['Nspec'].sum().reindex(table.index))
+    for measure in MEASURES:
+        for q in QUANTILES:
+            expected = groups[measure].quantile(q).reindex(table.index)
+            # Exact unless neighbouring values share a 1/20 dex histogram bin
+            np.testing.assert_allclose(np.log10(table[f'{measure} p{q * 100:g}']), np.log10(expected), atol=0.025)
+
+
+def test_small_groups_are_exact(real_catalogue):
+    df = survey_values(real_catalogue.frame)
+    table = real_catalogue.cube.rollup(['Facility']).set_index('Facility')
+    small = table.index[table['Surveys'] <= 2]
+    assert len(small) > 0
+    np.testing.assert_allclose(table.loc[small, 'Nspec p50'], df.groupby('Facility')['Nspec'].median()[small])
+
+
+def test_updated_matches_rebuild():
+    records = synthetic_surveys(3000)
+    raw = frame_from_records(records)
+    changed = frame_from_records(records[:300])
+    changed['Nspec'] = changed['Nspec'] * 3
+    cube = AggregateCube.from_frame(prepare_frame(raw)[0])
+    updated = cube.updated(removed=prepare_frame(raw.iloc[:400])[0], added=prepare_frame(changed)[0])
+    rebuilt = AggregateCube.from_frame(prepare_frame(pd.concat([raw.iloc[400:], changed]))[0])
+    by = ['Facility', 'Survey Status']
+    pd.testing.assert_frame_equal(updated.rollup(by), rebuilt.rollup(by), check_exact=False, rtol=1e-9)
@@ -0,0 +1,39 @@
+""" The /api routes: pagination cursors, lookups and conditional GET. """
+from api import encode_cursor
+
+
+def test_pages_cover_the_query(client, real_catalogue):
+    ids, url = [], '/api/surveys?sort=-Nspec&limit=10'
+    while url:
+        with client.get(url) as response:
+            assert response.status_code == 200
+            page = response.get_json()
+        ids += [survey['id'] for survey in page['surveys']]
+        url = page['next_cursor'] and f"/api/surveys?sort=-Nspec&limit=10&cursor={page['next_cursor']}"
+    assert page['count'] == len(ids) == len(set(ids)) == len(real_catalogue.frame)
+
+
+def test_stale_cursor(client):
+    with client.get(f"/api/surveys?cursor={encode_cursor('oldversion', 5)}") as response:
+        assert response.status_code == 409
+        assert response.get_json()['version'] != 'oldversion'
+
+
+def test_malformed_cursor(client, real_catalogue):
+    for cursor in (encode_cursor(real_catalogue.version, -3), 'not-a-cursor'):
+        with client.get(f'/api/surveys?cursor={cursor}') as response:
+            assert response.status_code == 400, cursor
+
+
+def test_unknown_survey(client):
+    with client.get('/api/surveys/no-such-survey') as response:
+        assert response.status_code == 404
+
+
+def test_conditional_get(client):
+    for url in ('/api/surveys?status=Complete', '/api/surveys/GAMA', '/api/summary?by=Facility'):
+        with client.get(url) as response:
+            assert response.status_code == 200, url
+            etag = response.headers['ETag']
+        with client.get(url, headers={'If-None-Match': etag}) as response:
+            assert response.status_code == 304, url
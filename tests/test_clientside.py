@@ -0,0 +1,61 @@
+""" assets/clientside.js filter_figure against the server-side figure, run under node. """
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from app import filtered_rows
+from figures import build_base_figure, compact_catalogue, figure_update, full_figure
+from tests.conftest import random_filter_state
+
+CLIENTSIDE_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'assets', 'clientside.js')
+
+# Loads clientside.js and runs filter_figure on every case read from stdin
+RUNNER = """
+const fs = require('fs');
+global.window = {dash_clientside: {no_update: null}};
+eval(fs.readFileSync(process.argv[1], 'utf8'));
+const input = JSON.parse(fs.readFileSync(0, 'utf8'));
+const filterFigure = window.dash_clientside.specsurveys.filter_figure;
+const figures = input.cases.map(c => filterFigure(c.status, c.facilities, c.nspec_log, c.resolution,
+                                                  c.search_matches, input.store));
+process.stdout.write(JSON.stringify(figures));
+"""
+
+SEARCHES = [None, 'desi', 'gal', 'sdss survey', 'nothing-matches-this']
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+
+
+def run_clientside(store, cases):
+    result = subprocess.run(['node', '-e', RUNNER, CLIENTSIDE_JS], input=json.dumps({'store': store, 'cases': cases}),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_filter_figure_matches_server(catalogue):
+    rng = np.random.default_rng(1)
+    base = build_base_figure()
+    store = compact_catalogue(catalogue, base)
+    cases, expected = [], []
+    for i in range(200):
+        status, facilities, nspec_log, resolution = random_filter_state(rng, catalogue)
+        search = SEARCHES[i % len(SEARCHES)]
+        matches = None if search is None else {'version': catalogue.version,
+                                               'rows': catalogue.search.matches(search).tolist()}
+        cases.append({'status': status, 'facilities': facilities, 'nspec_log': nspec_log,
+                      'resolution': resolution, 'search_matches': matches})
+        rows = filtered_rows(catalogue, status, facilities, nspec_log, resolution, search)
+        update = figure_update(catalogue.frame.iloc[rows], catalogue.wavelengths)
+        expected.append(json.loads(json.dumps(full_figure(base, catalogue.wavelengths, update))))
+
+    for case, figure, server in zip(cases, run_clientside(store, cases), expected):
+        assert figure['layout']['xaxis']['range'] == pytest.approx(server['layout']['xaxis']['range']), case
+        assert figure['layout']['yaxis']['range'] == pytest.approx(server['layout']['yaxis']['range']), case
+        assert len(figure['data']) == len(server['data'])
+        for trace, server_trace in zip(figure['data'], server['data']):
+            for prop in ('type', 'name', 'x', 'y', 'text', 'customdata', 'showlegend'):
+                assert trace.get(prop) == server_trace.get(prop), (case, prop)
@@ -0,0 +1,33 @@
+""" The /export/<format> route: formats, malformed filters and conditional GET. """
+
+
+def test_csv_export(client, real_catalogue):
+    with client.get('/export/csv?status=Complete') as response:
+        assert response.status_code == 200
+        assert 'surveys_data.csv' in response.headers['Content-Disposition']
+        lines = response.get_data(as_text=True).splitlines()
+    complete = (real_catalogue.frame['Survey Status'] == 'Complete').sum()
+    assert len(lines) == complete + 1
+
+
+def test_conditional_get(client):
+    with client.get('/export/csv?nspec=5') as response:
+        etag = response.headers['ETag']
+    with client.get('/export/csv?nspec=5', headers={'If-None-Match': etag}) as response:
+        assert response.status_code == 304
+        assert response.get_data() == b''
+    with client.get('/export/csv?nspec=6', headers={'If-None-Match': etag}) as response:
+        assert response.status_code == 200
+
+
+def test_unknown_format(client):
+    with client.get('/export/nonsense') as response:
+        assert response.status_code == 404
+        assert 'csv' in response.get_json()['error']
+
+
+def test_malformed_filters(client):
+    for query in ('nspec=400', 'nspec=abc', 'resolution=1,2,3'):
+        with client.get(f'/export/csv?{query}') as response:
+            assert response.status_code == 400, query
+            assert 'error' in response.get_json()
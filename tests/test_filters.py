@@ -0,0 +1,32 @@
+""" FilterIndex.query against the original pandas masks (benchmarks/legacy.py). """
+import numpy as np
+
+from app import filtered_rows
+from benchmarks.legacy import filter_mask
+from tests.conftest import random_filter_state
+
+
+def test_query_matches_legacy_masks(catalogue):
+    rng = np.random.default_rng(0)
+    for _ in range(1000):
+        status, facilities, nspec_log, resolution = random_filter_state(rng, catalogue)
+        expected = np.flatnonzero(filter_mask(catalogue.frame, status, facilities, nspec_log, resolution))
+        rows = catalogue.index.query(status=status, facilities=facilities, min_nspec=10 ** nspec_log,
+                                     resolution=resolution)
+        np.testing.assert_array_equal(rows, expected)
+
+
+def test_query_without_filters_returns_every_row(catalogue):
+    np.testing.assert_array_equal(catalogue.index.query(), np.arange(len(catalogue.frame)))
+
+
+
+def test_typed_nspec_keeps_that_survey(catalogue):
+    """ Typing a survey's exact Nspec (the slider gets its log10) never hides that survey. """
+    statuses = list(catalogue.frame['Survey Status'].cat.categories)
+    nspec = catalogue.frame['Nspec'].to_numpy()
+    # The legacy mask's own 10 ** log10(value) can land above value, so it filters on Nspec only via value
+    others = filter_mask(catalogue.frame, statuses, [], -np.inf, None).to_numpy()
+    for value in np.unique(nspec):
+        expected = np.flatnonzero(others & (nspec >= value))
+        np.testing.assert_array_equal(filtered_rows(catalogue, statuses, [], np.log10(value), None), expected)
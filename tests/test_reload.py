@@ -0,0 +1,80 @@
+""" CatalogueStore.reload() against a fresh load of the same survey directory. """
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from catalogue import SURVEY_DIR, CatalogueStore, load_catalogue
+
+
+@pytest.fixture
+def survey_dir(tmp_path):
+    return shutil.copytree(SURVEY_DIR, tmp_path / 'surveys')
+
+
+@pytest.fixture
+def store(survey_dir, tmp_path):
+    return CatalogueStore(str(survey_dir), str(tmp_path / 'missing.npz'))
+
+
+def edit_survey(path, **changes):
+    with open(path, encoding='utf-8') as f:
+        survey = json.load(f)
+    survey.update(changes)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(survey, f, indent=4)
+
+
+def assert_matches_fresh_load(store, tmp_path):
+    fresh = load_catalogue(store.survey_dir, str(tmp_path / 'missing.npz'))
+    current = store.current
+    assert current.version == fresh.version
+    assert sorted(current.frame['Survey']) == sorted(fresh.frame['Survey'])
+    for by in (['Facility'], ['Selection Wavelength', 'Survey Status'], []):
+        pd.testing.assert_frame_equal(current.cube.rollup(by), fresh.cube.rollup(by), check_exact=False, rtol=1e-9)
+
+
+def test_file_added(store, survey_dir, tmp_path):
+    shutil.copy(survey_dir / 'GAMA.json', survey_dir / 'GAMA-copy.json')
+    edit_survey(survey_dir / 'GAMA-copy.json', Survey='GAMA-copy', Nspec=12345)
+    catalogue = store.reload()
+    assert catalogue is store.current
+    assert 'GAMA-copy' in set(catalogue.frame['Survey'])
+    assert_matches_fresh_load(store, tmp_path)
+
+
+def test_file_changed(store, survey_dir, tmp_path):
+    edit_survey(survey_dir / 'GAMA.json', Nspec=54321, Facility='New Telescope')
+    catalogue = store.reload()
+    row = catalogue.frame[catalogue.frame['Survey'] == 'GAMA'].iloc[0]
+    assert (row['Nspec'], row['Facility']) == (54321, 'New Telescope')
+    assert_matches_fresh_load(store, tmp_path)
+
+
+def test_file_removed(store, survey_dir, tmp_path):
+    removed = store.current.frame['Survey'].iloc[list(store.current.sources).index('2MRS.json')]
+    os.remove(survey_dir / '2MRS.json')
+    catalogue = store.reload()
+    assert removed not in set(catalogue.frame['Survey'])
+    assert store.reload() is None
+    assert_matches_fresh_load(store, tmp_path)
+
+
+def test_same_content_is_not_a_change(store, survey_dir):
+    version = store.current.version
+    path = survey_dir / 'GAMA.json'
+    content = path.read_bytes()
+    path.write_bytes(content)
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert store.reload() is None
+    assert store.current.version == version
+
+
+def test_listeners_get_the_new_catalogue(store, survey_dir):
+    seen = []
+    store.subscribe(seen.append)
+    edit_survey(survey_dir / 'GAMA.json', Nspec=1)
+    catalogue = store.reload()
+    assert seen == [catalogue]
@@ -0,0 +1,20 @@
+""" benchmarks.synthetic.write_catalogue never overwrites a directory it was not told to. """
+import pytest
+
+from benchmarks.synthetic import write_catalogue
+from catalogue import SURVEY_DIR
+
+
+def test_refuses_non_empty_directory(tmp_path):
+    (tmp_path / 'notes.txt').write_text('keep me')
+    with pytest.raises(ValueError):
+        write_catalogue(70, str(tmp_path))
+    assert (tmp_path / 'notes.txt').exists()
+    write_catalogue(70, str(tmp_path), force=True)
+    assert not (tmp_path / 'notes.txt').exists()
+    assert len(list(tmp_path.glob('*.json'))) == 70
+
+
+def test_refuses_survey_library():
+    with pytest.raises(ValueError):
+        write_catalogue(70, SURVEY_DIR + '/', force=True)